@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 from configparser import ConfigParser
+from django.core.exceptions import ImproperlyConfigured
 
 config = ConfigParser()
 config.read("./config.ini")
@@ -29,7 +30,7 @@ SECRET_KEY = config.get("DJANGO", "SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
 # DEBUG = config.get("DJANGO", "DEBUG")
-DEBUG = config.get("DJANGO", "DEBUG")
+DEBUG = config.getboolean("DJANGO", "DEBUG")
 
 ALLOWED_HOSTS = config.get("DJANGO", "ALLOWED_HOSTS").split(",")
 
@@ -57,6 +58,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.PolitiqueContenuMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware'
@@ -66,6 +68,10 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173"
 ]
 
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PaginationCurseur',
+}
+
 ROOT_URLCONF = 'Bibliotheque.urls'
 
 TEMPLATES = [
@@ -86,6 +92,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'Bibliotheque.wsgi.application'
 
+# Versions asynchrones des vues de lecture les plus sollicitées, activées par Bibliotheque/asgi.py
+VUES_ASYNCHRONES = os.environ.get('BIBLIOTHEQUE_VUES_ASYNCHRONES') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -97,6 +106,25 @@ DATABASES = {
     }
 }
 
+# Cache : Redis, partagé par tous les processus. La mémoire locale n'est acceptée qu'en DEBUG (développement, tests) :
+# les compteurs de génération des fragments y seraient propres à chaque processus.
+if config.has_section("REDIS"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config.get("REDIS", "LOCATION"),
+        }
+    }
+elif not DEBUG:
+    raise ImproperlyConfigured("Une section [REDIS] est requise dans config.ini lorsque DEBUG est désactivé.")
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bibliotheque',
+        }
+    }
+
 
 
 # Password validation
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class apiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from .recherche import creer_table_recherche
+        from . import versions, statistiques
+        post_migrate.connect(creer_table_recherche, sender=self)
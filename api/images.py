@@ -0,0 +1,104 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+IMAGE_PAR_DEFAUT = "default.png"
+DOSSIER_RENDITIONS = "renditions"
+TAILLES = {
+    'liste': (300, 450),
+    'detail': (800, 1200),
+}
+FORMATS_PIL = {
+    'avif': 'AVIF',
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+}
+Image.init()
+FORMATS_MODERNES = [nom for nom in ('avif', 'webp') if FORMATS_PIL[nom] in Image.SAVE]
+
+logger = logging.getLogger(__name__)
+
+_executeur = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'RENDITIONS_TRAVAILLEURS', 2),
+    thread_name_prefix='renditions'
+)
+
+def _nom_rendition(nom_image, taille, extension):
+    racine = os.path.splitext(nom_image)[0]
+    dossier, fichier = os.path.split(racine)
+    return os.path.join(dossier, DOSSIER_RENDITIONS, f"{fichier}_{taille}.{extension}")
+
+def _encoder(image, extension):
+    tampon = BytesIO()
+    if extension == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.save(tampon, FORMATS_PIL[extension], quality=80)
+    return ContentFile(tampon.getvalue())
+
+def creer_renditions(nom_image):
+    variantes = []
+    with default_storage.open(nom_image) as fichier, Image.open(fichier) as original:
+        original.load()
+        extension_origine = 'png' if original.format == 'PNG' else 'jpeg'
+        for taille, dimensions in TAILLES.items():
+            image = original.copy()
+            image.thumbnail(dimensions)
+            for extension in [*FORMATS_MODERNES, extension_origine]:
+                nom = _nom_rendition(nom_image, taille, extension)
+                if default_storage.exists(nom):
+                    default_storage.delete(nom)
+                default_storage.save(nom, _encoder(image, extension))
+                variantes.append({
+                    'taille': taille,
+                    'format': extension,
+                    'largeur': image.width,
+                    'nom': nom,
+                })
+    return {'source': nom_image, 'variantes': variantes}
+
+def supprimer_renditions(renditions):
+    for variante in (renditions or {}).get('variantes', []):
+        if default_storage.exists(variante['nom']):
+            default_storage.delete(variante['nom'])
+
+def generer_renditions(livre_id):
+    from .models import Livre
+    from .versions import toucher_livres
+    livre = Livre.objects.filter(pk=livre_id).only('image', 'renditions').first()
+    if livre is None or not livre.image or livre.image.name == IMAGE_PAR_DEFAUT:
+        return
+    if (livre.renditions or {}).get('source') == livre.image.name:
+        return
+    renditions = creer_renditions(livre.image.name)
+    if Livre.objects.filter(pk=livre_id, image=livre.image.name).update(renditions=renditions):
+        toucher_livres([livre_id])
+    else:
+        supprimer_renditions(renditions)
+
+def _generer_renditions_en_arriere_plan(livre_id):
+    try:
+        generer_renditions(livre_id)
+    finally:
+        connection.close()
+
+def _signaler_echec(future, livre_id):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Échec de la génération des renditions du livre %s", livre_id, exc_info=future.exception())
+
+def _soumettre_renditions(livre_id):
+    future = _executeur.submit(_generer_renditions_en_arriere_plan, livre_id)
+    future.add_done_callback(lambda future: _signaler_echec(future, livre_id))
+
+def planifier_renditions(livre):
+    livre_id = livre.pk
+    if getattr(settings, 'RENDITIONS_SYNCHRONES', False):
+        transaction.on_commit(lambda: generer_renditions(livre_id))
+    else:
+        transaction.on_commit(lambda: _soumettre_renditions(livre_id))
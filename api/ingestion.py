@@ -0,0 +1,216 @@
+import csv
+import json
+import re
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.db.models.functions import Lower
+from .models import Livre, Auteur, Tag, recalculer_pour_adulte
+from .recherche import indexer_livres
+from .versions import incrementer_versions, toucher_livres, AUTOCOMPLETION_LIVRE
+from .statistiques import recalculer_rollups_livres
+
+TAILLE_LOT = 1000
+CHAMPS_LIVRE = ('nom', 'date_sortie', 'nombre_pages', 'synopsis', 'edition')
+CREE = 'cree'
+MIS_A_JOUR = 'mis_a_jour'
+ERREUR = 'erreur'
+IGNORE = 'ignore'
+CHAMPS_IMPORT = ('isbn', *CHAMPS_LIVRE)
+SEPARATEUR = ','
+
+def _noms(valeurs):
+    noms = {}
+    for nom in valeurs or ():
+        if nom and nom.strip():
+            noms.setdefault(nom.strip().lower(), nom.strip())
+    return list(noms.values())
+
+class IngestionCatalogue:
+    def __init__(self, using=DEFAULT_DB_ALIAS, taille_lot=TAILLE_LOT):
+        self.using = using
+        self.taille_lot = taille_lot
+        self.auteurs = {}
+        self.tags = {}
+
+    def _resoudre(self, modele, champ, cache, noms, defauts=None):
+        manquants = [nom for nom in noms if nom.lower() not in cache]
+        for debut in range(0, len(manquants), self.taille_lot):
+            lot = manquants[debut:debut + self.taille_lot]
+            # LOWER() de SQLite ne replie que l'ASCII : les noms identiques sont aussi cherchés tels quels.
+            existants = modele.objects.using(self.using).annotate(cle=Lower(champ)).filter(
+                Q(cle__in=[nom.lower() for nom in lot]) | Q(**{f'{champ}__in': lot})
+            ).order_by('id')
+            for identifiant, nom in existants.values_list('id', champ):
+                cache.setdefault(nom.lower(), identifiant)
+            nouveaux = [nom for nom in lot if nom.lower() not in cache]
+            if nouveaux:
+                modele.objects.using(self.using).bulk_create(
+                    [modele(**{champ: nom}, **(defauts or {})) for nom in nouveaux]
+                )
+                crees = modele.objects.using(self.using).filter(**{f'{champ}__in': nouveaux}).order_by('id')
+                for identifiant, nom in crees.values_list('id', champ):
+                    cache.setdefault(nom.lower(), identifiant)
+                incrementer_versions([modele._meta.model_name], self.using)
+
+    def _identifiants(self, cache, noms):
+        return [cache[nom.lower()] for nom in _noms(noms)]
+
+    def _upsert(self, lignes, existants):
+        incompletes = [ligne['isbn'] for ligne in lignes if ligne['isbn'] in existants and not ligne.keys() >= set(CHAMPS_LIVRE)]
+        actuels = {
+            livre['isbn']: livre
+            for livre in Livre.objects.using(self.using).filter(isbn__in=incompletes).values('isbn', *CHAMPS_LIVRE)
+        } if incompletes else {}
+        options = {'update_conflicts': True, 'update_fields': list(CHAMPS_LIVRE)}
+        if connections[self.using].features.supports_update_conflicts_with_target:
+            options['unique_fields'] = ['isbn']
+        Livre.objects.using(self.using).bulk_create(
+            [Livre(**{**actuels.get(ligne['isbn'], {}), **{champ: ligne[champ] for champ in CHAMPS_IMPORT if champ in ligne}}) for ligne in lignes],
+            batch_size=self.taille_lot,
+            **options
+        )
+        return dict(Livre.objects.using(self.using).filter(isbn__in=[ligne['isbn'] for ligne in lignes]).values_list('isbn', 'id'))
+
+    def _remplacer_relations(self, relation, colonne, liens):
+        through = getattr(Livre, relation).through
+        through.objects.using(self.using).filter(livre_id__in=list(liens)).delete()
+        through.objects.using(self.using).bulk_create(
+            [through(livre_id=livre_id, **{colonne: cible}) for livre_id, cibles in liens.items() for cible in cibles],
+            batch_size=self.taille_lot,
+            ignore_conflicts=True
+        )
+
+    def _ingerer_lot(self, lignes):
+        par_isbn = {ligne['isbn']: ligne for ligne in lignes}
+        uniques = list(par_isbn.values())
+        existants = set(Livre.objects.using(self.using).filter(isbn__in=list(par_isbn)).values_list('isbn', flat=True))
+        ids = self._upsert(uniques, existants)
+        self._resoudre(Auteur, 'nom', self.auteurs, _noms(nom for ligne in uniques for nom in ligne.get('auteurs') or ()))
+        self._resoudre(Tag, 'tag', self.tags, _noms(nom for ligne in uniques for nom in ligne.get('tags') or ()), {'pour_adulte': False})
+        auteurs = {ids[ligne['isbn']]: self._identifiants(self.auteurs, ligne['auteurs']) for ligne in uniques if 'auteurs' in ligne}
+        tags = {ids[ligne['isbn']]: self._identifiants(self.tags, ligne['tags']) for ligne in uniques if 'tags' in ligne}
+        anciens_auteurs = set(
+            Livre.auteurs.through.objects.using(self.using).filter(livre_id__in=list(auteurs)).values_list('auteur_id', flat=True)
+        )
+        if auteurs:
+            self._remplacer_relations('auteurs', 'auteur_id', auteurs)
+        if tags:
+            self._remplacer_relations('tags', 'tag_id', tags)
+        livres = list(ids.values())
+        recalculer_pour_adulte(livres, self.using)
+        indexer_livres(livres, self.using)
+        toucher_livres(livres, self.using, auteurs=anciens_auteurs, cles=[AUTOCOMPLETION_LIVRE])
+        recalculer_rollups_livres([ids[isbn] for isbn in existants], self.using)
+        return [
+            {'isbn': ligne['isbn'], 'id': ids[ligne['isbn']], 'statut': MIS_A_JOUR if ligne['isbn'] in existants else CREE}
+            if par_isbn[ligne['isbn']] is ligne else
+            {'isbn': ligne['isbn'], 'id': None, 'statut': IGNORE, 'erreurs': ["ISBN repris par une ligne suivante du même lot."]}
+            for ligne in lignes
+        ]
+
+    def ingerer(self, lignes):
+        resultats = []
+        lignes = list(lignes)
+        for debut in range(0, len(lignes), self.taille_lot):
+            try:
+                with transaction.atomic(using=self.using):
+                    resultats.extend(self._ingerer_lot(lignes[debut:debut + self.taille_lot]))
+            except Exception:
+                self.auteurs.clear()
+                self.tags.clear()
+                raise
+        return resultats
+
+def _liste(valeur, separateur):
+    if isinstance(valeur, str):
+        return [nom.strip() for nom in valeur.split(separateur) if nom.strip()]
+    return valeur
+
+def _ligne(donnees, separateur):
+    ligne = {champ: donnees[champ] for champ in CHAMPS_IMPORT if donnees.get(champ) not in (None, '')}
+    for relation in ('auteurs', 'tags'):
+        if relation in donnees:
+            ligne[relation] = _liste(donnees[relation] or [], separateur)
+    return ligne
+
+def lire_csv(fichier, separateur=SEPARATEUR):
+    lecteur = csv.DictReader(fichier)
+    for donnees in lecteur:
+        yield lecteur.line_num, _ligne(donnees, separateur)
+
+def lire_jsonl(fichier, separateur=SEPARATEUR):
+    for numero, texte in enumerate(fichier, start=1):
+        if not texte.strip():
+            continue
+        try:
+            donnees = json.loads(texte)
+        except ValueError:
+            yield numero, None
+            continue
+        yield numero, _ligne(donnees, separateur) if isinstance(donnees, dict) else None
+
+def _sous_champs(donnees):
+    sous_champs = {}
+    for morceau in donnees.split('$')[1:]:
+        if morceau:
+            sous_champs.setdefault(morceau[0], morceau[1:].replace('{dollar}', '$').strip())
+    return sous_champs
+
+def _nettoyer(valeur):
+    return valeur.strip().rstrip(' /:;,.').strip()
+
+def _nom_marc(valeur, indicateur):
+    valeur = _nettoyer(valeur)
+    if indicateur == '1' and ', ' in valeur:
+        nom, prenom = valeur.split(', ', 1)
+        return f'{prenom} {nom}'
+    return valeur
+
+def _notice_marc(champs):
+    notice = {'auteurs': [], 'tags': []}
+    for etiquette, donnees in champs:
+        if etiquette == '008':
+            if donnees[7:11].isdigit():
+                notice.setdefault('date_sortie', f'{donnees[7:11]}-01-01')
+            continue
+        indicateurs, sous_champs = donnees[:2], _sous_champs(donnees[2:])
+        a = sous_champs.get('a', '')
+        if etiquette == '020' and a and 'isbn' not in notice:
+            notice['isbn'] = ''.join(re.findall(r'\d', a.split()[0]))
+        elif etiquette == '245' and a:
+            notice['nom'] = _nettoyer(' : '.join(filter(None, [_nettoyer(a), sous_champs.get('b')])))
+        elif etiquette in ('100', '110', '700', '710') and a:
+            notice['auteurs'].append(_nom_marc(a, indicateurs[:1]))
+        elif etiquette in ('650', '655') and a:
+            notice['tags'].append(_nettoyer(a))
+        elif etiquette == '250' and a:
+            notice['edition'] = _nettoyer(a)
+        elif etiquette in ('260', '264') and (annee := re.search(r'\d{4}', sous_champs.get('c', ''))):
+            notice['date_sortie'] = f'{annee.group()}-01-01'
+        elif etiquette == '300' and (pages := re.search(r'\d+', a)):
+            notice['nombre_pages'] = pages.group()
+        elif etiquette == '520' and a:
+            notice['synopsis'] = a
+    return notice
+
+def lire_marc(fichier, separateur=SEPARATEUR):
+    champs, debut = [], None
+    for numero, texte in enumerate(fichier, start=1):
+        texte = texte.rstrip('\r\n')
+        if texte.startswith('=LDR') or not texte.strip():
+            if champs:
+                yield debut, _notice_marc(champs)
+            champs, debut = [], None
+            if not texte.strip():
+                continue
+        if texte.startswith('=') and len(texte) > 4:
+            debut = debut or numero
+            champs.append((texte[1:4], texte[6:]))
+    if champs:
+        yield debut, _notice_marc(champs)
+
+LECTEURS = {
+    'csv': lire_csv,
+    'jsonl': lire_jsonl,
+    'mrk': lire_marc,
+}
@@ -0,0 +1,42 @@
+import random
+from datetime import date
+from api.models import Livre, Auteur, Tag, recalculer_pour_adulte
+from api.versions import incrementer_versions, AUTOCOMPLETION_LIVRE
+
+TAILLE_LOT = 5000
+
+def generer_catalogue(nombre_livres, nombre_auteurs=2000, nombre_tags=50, graine=0, premier=0):
+    aleatoire = random.Random(graine)
+    auteurs = Auteur.objects.bulk_create(
+        [Auteur(nom=f"Auteur factice {i}") for i in range(nombre_auteurs)],
+        batch_size=TAILLE_LOT
+    )
+    tags = Tag.objects.bulk_create(
+        [Tag(tag=f"Tag factice {i}", pour_adulte=(i % 10 == 0)) for i in range(nombre_tags)],
+        batch_size=TAILLE_LOT
+    )
+    nouveaux_ids = []
+    for debut in range(premier, premier + nombre_livres, TAILLE_LOT):
+        livres = Livre.objects.bulk_create([
+            Livre(
+                nom=f"Livre factice {i}",
+                date_sortie=date(1900 + i % 120, 1 + i % 12, 1 + i % 28),
+                nombre_pages=50 + i % 900,
+                synopsis=f"Synopsis du livre factice {i}",
+                isbn=f"{9790000000000 + i}",
+            )
+            for i in range(debut, min(debut + TAILLE_LOT, premier + nombre_livres))
+        ])
+        nouveaux_ids.extend(livre.id for livre in livres)
+        Livre.auteurs.through.objects.bulk_create([
+            Livre.auteurs.through(livre_id=livre.id, auteur_id=aleatoire.choice(auteurs).id)
+            for livre in livres
+        ])
+        Livre.tags.through.objects.bulk_create([
+            Livre.tags.through(livre_id=livre.id, tag_id=tag.id)
+            for livre in livres
+            for tag in aleatoire.sample(tags, 3)
+        ])
+    recalculer_pour_adulte(nouveaux_ids)
+    incrementer_versions([AUTOCOMPLETION_LIVRE])
+    return auteurs, tags
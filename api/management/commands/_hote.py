@@ -0,0 +1,4 @@
+from django.conf import settings
+
+def hote_local():
+    return next((hote for hote in settings.ALLOWED_HOSTS if hote and hote != '*' and not hote.startswith('.')), 'localhost')
@@ -0,0 +1,46 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+from api.models import Livre
+from api.recherche import RechercheLivres, indexer_livres
+from ._catalogue_factice import generer_catalogue
+
+TAILLE_PAGE = 50
+
+class Command(BaseCommand):
+    help = "Mesure le nombre de requêtes et la latence des recherches combinées sur un catalogue factice (annulé en fin de mesure)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--livres', type=int, default=100000)
+        parser.add_argument('--repetitions', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write(f"Génération de {options['livres']} livres...")
+            dernier_id = Livre.objects.aggregate(dernier_id=Max('id'))['dernier_id'] or 0
+            auteurs, tags = generer_catalogue(options['livres'])
+            indexer_livres(Livre.objects.filter(id__gt=dernier_id).values_list('id', flat=True), remplacer=False)
+            scenarios = {
+                'texte': RechercheLivres(texte='factice 4242'),
+                'tags (ET)': RechercheLivres(tags=tags[1:3]),
+                'tags (OU)': RechercheLivres(tags=tags[1:3], mode_tags=RechercheLivres.OU),
+                'auteur': RechercheLivres(auteur=auteurs[7]),
+                'combinée': RechercheLivres(texte='factice', tags=tags[1:3], mode_tags=RechercheLivres.OU, auteur=auteurs[7]),
+            }
+            for nom, recherche in scenarios.items():
+                durees = []
+                for _ in range(options['repetitions']):
+                    debut = time.perf_counter()
+                    with CaptureQueriesContext(connection) as requetes:
+                        livres = recherche.appliquer(Livre.objects.filter(est_pour_adulte=False).prefetch_related('auteurs'))
+                        total = livres.count()
+                        list(livres[:TAILLE_PAGE])
+                    durees.append((time.perf_counter() - debut) * 1000)
+                self.stdout.write(
+                    f"{nom:<12} {total:>7} résultat(s)  {len(requetes)} requête(s)  "
+                    f"médiane {statistics.median(durees):.1f} ms"
+                )
+            transaction.set_rollback(True)
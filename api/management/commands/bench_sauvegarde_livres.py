@@ -0,0 +1,52 @@
+import time
+from datetime import date
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from PIL import Image
+from api.models import Livre
+
+class Command(BaseCommand):
+    help = "Mesure le coût de mises à jour de livres qui ne touchent que les métadonnées (annulées en fin de mesure)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--livres', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        tampon = BytesIO()
+        Image.new('RGB', (800, 1200), 'gray').save(tampon, 'JPEG')
+        nom_image = default_storage.save('livres/bench_couverture.jpg', ContentFile(tampon.getvalue()))
+        try:
+            with transaction.atomic():
+                Livre.objects.bulk_create([
+                    Livre(
+                        nom=f"Livre bench {i}",
+                        date_sortie=date(2000, 1, 1),
+                        nombre_pages=100,
+                        synopsis="",
+                        image=nom_image,
+                    )
+                    for i in range(options['livres'])
+                ], batch_size=1000)
+                livres = list(Livre.objects.filter(nom__startswith="Livre bench "))
+                requetes = []
+
+                def compter(execute, sql, params, many, context):
+                    requetes.append(sql)
+                    return execute(sql, params, many, context)
+
+                debut = time.perf_counter()
+                with connection.execute_wrapper(compter):
+                    for livre in livres:
+                        livre.synopsis = f"Synopsis modifié de {livre.nom}"
+                        livre.save()
+                duree = time.perf_counter() - debut
+                transaction.set_rollback(True)
+        finally:
+            default_storage.delete(nom_image)
+        self.stdout.write(
+            f"{len(livres)} sauvegarde(s) : {duree:.2f} s, {duree / len(livres) * 1000:.3f} ms et "
+            f"{len(requetes) / len(livres):.1f} requête(s) par sauvegarde"
+        )
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils.http import urlencode
+from api.models import Livre, User
+from ._hote import hote_local
+
+MODES = ('wsgi', 'asgi')
+
+def _wsgi(chemins, cookie, travailleurs):
+    handler = WSGIHandler()
+    hote = hote_local()
+
+    def appeler(chemin):
+        chemin_seul, _, requete = chemin.partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': chemin_seul,
+            'QUERY_STRING': requete,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': hote,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': hote,
+            'HTTP_COOKIE': cookie,
+            'wsgi.input': BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        statut = []
+        debut = time.perf_counter()
+        reponse = handler(environ, lambda ligne, entetes, exc_info=None: statut.append(int(ligne.split()[0])))
+        try:
+            for _ in reponse:
+                pass
+        finally:
+            reponse.close()
+        return chemin, statut[0], time.perf_counter() - debut
+
+    with ThreadPoolExecutor(max_workers=travailleurs) as executeur:
+        list(executeur.map(appeler, dict.fromkeys(chemins)))
+        debut = time.perf_counter()
+        resultats = list(executeur.map(appeler, chemins))
+    return resultats, time.perf_counter() - debut
+
+async def _asgi(chemins, cookie, travailleurs):
+    handler = ASGIHandler()
+    hote = hote_local()
+    semaphore = asyncio.Semaphore(travailleurs)
+
+    async def recevoir():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def appeler(chemin):
+        chemin_seul, _, requete = chemin.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': chemin_seul,
+            'raw_path': chemin_seul.encode(),
+            'query_string': requete.encode(),
+            'root_path': '',
+            'headers': [(b'host', hote.encode()), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': (hote, 80),
+        }
+        statut = []
+
+        async def envoyer(message):
+            if message['type'] == 'http.response.start':
+                statut.append(message['status'])
+
+        async with semaphore:
+            debut = time.perf_counter()
+            await handler(scope, recevoir, envoyer)
+            return chemin, statut[0], time.perf_counter() - debut
+
+    await asyncio.gather(*(appeler(chemin) for chemin in dict.fromkeys(chemins)))
+    debut = time.perf_counter()
+    resultats = await asyncio.gather(*(appeler(chemin) for chemin in chemins))
+    return resultats, time.perf_counter() - debut
+
+class Command(BaseCommand):
+    help = (
+        "Compare le débit des vues de lecture servies en WSGI (vues synchrones, un thread par travailleur) "
+        "et en ASGI (vues asynchrones, autant de requêtes simultanées que de travailleurs), chaque mode dans son propre processus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--travailleurs', type=int, default=8)
+        parser.add_argument('--requetes', type=int, default=400)
+        parser.add_argument('--utilisateur', help="Utilisateur au nom duquel les pages sont demandées (anonyme par défaut).")
+        parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+        parser.add_argument('--cookie', default='', help=argparse.SUPPRESS)
+        parser.add_argument('--chemins', nargs='*', default=[], help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            self._mesurer(options)
+            return
+        session = self._session(options['utilisateur'])
+        cookie = f'{settings.SESSION_COOKIE_NAME}={session.session_key}' if session else ''
+        chemins = self._chemins(session is not None)
+        self.stdout.write(f"{options['requetes']} requête(s), {options['travailleurs']} travailleur(s), {len(chemins)} page(s)")
+        try:
+            for mode in MODES:
+                resultats = self._lancer(mode, chemins, cookie, options)
+                self.stdout.write(
+                    f"{mode.upper()}  {resultats['debit']:.1f} req/s  médiane {resultats['mediane']:.1f} ms  "
+                    f"p95 {resultats['p95']:.1f} ms  statuts {resultats['statuts']}"
+                )
+                for chemin, mediane in resultats['pages'].items():
+                    self.stdout.write(f"    {chemin:<40} médiane {mediane:.1f} ms")
+        finally:
+            if session:
+                session.delete()
+
+    def _session(self, nom_utilisateur):
+        if not nom_utilisateur:
+            return None
+        try:
+            utilisateur = User.objects.get(username=nom_utilisateur)
+        except User.DoesNotExist:
+            raise CommandError(f"Utilisateur introuvable : {nom_utilisateur}")
+        session = SessionStore()
+        session[SESSION_KEY] = str(utilisateur.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = utilisateur.get_session_auth_hash()
+        session.create()
+        return session
+
+    def _chemins(self, connecte):
+        livre = Livre.objects.filter(est_pour_adulte=False, auteurs__isnull=False).order_by('id').first()
+        if livre is None:
+            raise CommandError("Le catalogue ne contient aucun livre avec auteur.")
+        chemins = [
+            reverse('livres:rechercher'),
+            f"{reverse('livres:rechercher')}?{urlencode({'recherche': livre.nom})}",
+            reverse('livres:detail_livre', args=[livre.id]),
+            reverse('livres:detail_auteur', args=[livre.auteurs.first().id]),
+        ]
+        if connecte:
+            chemins.append(reverse('livres:liste_de_souhaits'))
+        return chemins
+
+    def _lancer(self, mode, chemins, cookie, options):
+        environnement = {**os.environ, 'BIBLIOTHEQUE_VUES_ASYNCHRONES': '1' if mode == 'asgi' else '0'}
+        commande = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_wsgi_asgi',
+            '--mode', mode,
+            '--travailleurs', str(options['travailleurs']),
+            '--requetes', str(options['requetes']),
+            '--cookie', cookie,
+            '--chemins', *chemins,
+        ]
+        sortie = subprocess.run(commande, env=environnement, capture_output=True, text=True, cwd=settings.BASE_DIR)
+        if sortie.returncode:
+            raise CommandError(f"Échec de la mesure {mode} :\n{sortie.stderr}")
+        return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+    def _mesurer(self, options):
+        if settings.VUES_ASYNCHRONES != (options['mode'] == 'asgi'):
+            raise CommandError("BIBLIOTHEQUE_VUES_ASYNCHRONES ne correspond pas au mode demandé.")
+        chemins = [options['chemins'][index % len(options['chemins'])] for index in range(options['requetes'])]
+        if options['mode'] == 'wsgi':
+            resultats, duree = _wsgi(chemins, options['cookie'], options['travailleurs'])
+        else:
+            resultats, duree = asyncio.run(_asgi(chemins, options['cookie'], options['travailleurs']))
+        durees = sorted(ecoule * 1000 for _, _, ecoule in resultats)
+        statuts = {}
+        for _, statut, _ in resultats:
+            statuts[statut] = statuts.get(statut, 0) + 1
+        self.stdout.write(json.dumps({
+            'debit': len(resultats) / duree,
+            'mediane': statistics.median(durees),
+            'p95': durees[int(len(durees) * 0.95) - 1],
+            'statuts': statuts,
+            'pages': {
+                chemin: statistics.median(ecoule * 1000 for page, _, ecoule in resultats if page == chemin)
+                for chemin in dict.fromkeys(chemins)
+            },
+        }))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from api.versions import toucher_livres
+from api.recommandations import K, MATRICES, calculer_recommandations
+
+class Command(BaseCommand):
+    help = (
+        "Calcule hors ligne les voisins les plus proches de chaque livre (similarité cosinus), "
+        "d'après les notes des lecteurs et d'après les tags et auteurs partagés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=sorted(MATRICES), action='append', help="Par défaut, tous les types.")
+        parser.add_argument('-k', type=int, default=K, help="Nombre de voisins conservés par livre.")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if options['k'] < 1:
+            raise CommandError("k doit être positif.")
+        for type in options['type'] or sorted(MATRICES):
+            debut = time.monotonic()
+            nombre = calculer_recommandations(type, options['k'], options['database'])
+            self.stdout.write(f"{type} : {nombre} recommandation(s) en {time.monotonic() - debut:.1f} s")
+        toucher_livres(using=options['database'])
+        self.stdout.write(self.style.SUCCESS("Recommandations à jour."))
@@ -0,0 +1,141 @@
+import json
+import re
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils.http import urlencode
+from api.models import Auteur, Lecture, Livre, Tag, User
+from ._hote import hote_local
+
+INSTRUCTIONS = ('SELECT', 'UPDATE', 'DELETE')
+PARCOURS_SQLITE = re.compile(r'^SCAN (?:TABLE )?(\S+)(.*)$')
+TRI_SQLITE = re.compile(r'^USE TEMP B-TREE FOR (?:ORDER|GROUP|DISTINCT)')
+LONGUEUR_SQL = 300
+
+def _plan_sqlite(curseur, sql, params):
+    curseur.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+    problemes = []
+    for *_, detail in curseur.fetchall():
+        parcours = PARCOURS_SQLITE.match(detail)
+        if parcours:
+            table, suite = parcours.groups()
+            if not table.startswith('(') and table != 'CONSTANT' and 'USING' not in suite and 'VIRTUAL TABLE' not in suite:
+                problemes.append((table, 'parcours complet'))
+        elif TRI_SQLITE.match(detail):
+            problemes.append(('', 'tri sans index'))
+    return problemes
+
+def _plan_mysql(curseur, sql, params):
+    curseur.execute(f'EXPLAIN {sql}', params)
+    colonnes = [colonne[0] for colonne in curseur.description]
+    problemes = []
+    for ligne in curseur.fetchall():
+        ligne = dict(zip(colonnes, ligne))
+        if ligne.get('type') == 'ALL':
+            problemes.append((ligne['table'], f"parcours complet (~{ligne.get('rows')} ligne(s))"))
+        if 'Using filesort' in (ligne.get('Extra') or ''):
+            problemes.append((ligne['table'], 'tri sans index'))
+    return problemes
+
+PLANS = {
+    'sqlite': _plan_sqlite,
+    'mysql': _plan_mysql,
+}
+
+class Command(BaseCommand):
+    help = "Rejoue avec EXPLAIN les requêtes des pages principales (ou d'un fichier enregistré) et signale les parcours complets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilisateur', help="Nom de l'utilisateur connecté pour les pages personnelles.")
+        parser.add_argument('--rejouer', metavar='FICHIER', help="Rejoue les requêtes d'un fichier JSONL au lieu de parcourir les pages.")
+        parser.add_argument('--enregistrer', metavar='FICHIER', help="Enregistre les requêtes relevées dans un fichier JSONL.")
+
+    def _pages(self, utilisateur):
+        livre = Livre.objects.filter(est_pour_adulte=False).order_by('id').first()
+        auteur = Auteur.objects.order_by('id').first()
+        tag = Tag.objects.filter(pour_adulte=False).order_by('id').first()
+        if livre is None or auteur is None or tag is None:
+            raise CommandError("Le catalogue doit contenir au moins un livre, un auteur et un tag.")
+        rechercher = reverse('livres:rechercher')
+        pages = [
+            (rechercher, None),
+            (f"{rechercher}?{urlencode({'recherche': livre.nom.split()[0]})}", None),
+            (f"{rechercher}?{urlencode({'tri': 'mieux_notes'})}", None),
+            (f"{rechercher}?{urlencode({'tri': 'plus_lus'})}", None),
+            (f"{rechercher}?{urlencode({'auteur': auteur.id})}", None),
+            (f"{rechercher}?{urlencode({'tags': tag.id})}", None),
+            (f"{reverse('livres:liste_auteurs')}?{urlencode({'recherche': auteur.nom[:3]})}", None),
+            (f"{reverse('livres:liste_tags')}?{urlencode({'recherche': tag.tag[:3]})}", None),
+            (reverse('livres:detail_livre', args=[livre.id]), None),
+            (reverse('livres:detail_auteur', args=[auteur.id]), None),
+            (f"{reverse('livres:statistiques')}?portee=site", None),
+        ]
+        if utilisateur:
+            lecture = Lecture.objects.filter(lecteur=utilisateur).order_by('id').first()
+            if lecture:
+                pages.append((reverse('livres:detail_livre', args=[lecture.livre_id]), None))
+            pages += [
+                (reverse('livres:bibliotheque'), None),
+                (reverse('livres:bibliotheque'), {'recherche': '', 'statut': 'lu'}),
+                (reverse('livres:statistiques'), None),
+                (reverse('livres:liste_de_souhaits'), None),
+                (reverse('livres:exporter_lectures', args=['csv']), None),
+            ]
+        return pages
+
+    def _relever(self, nom_utilisateur):
+        utilisateur = None
+        if nom_utilisateur:
+            try:
+                utilisateur = User.objects.get(username=nom_utilisateur)
+            except User.DoesNotExist:
+                raise CommandError(f"Utilisateur introuvable : {nom_utilisateur}")
+        client = Client(HTTP_HOST=hote_local())
+        if utilisateur:
+            client.force_login(utilisateur)
+        requetes = {}
+        for chemin, donnees in self._pages(utilisateur):
+            def relever(execute, sql, params, many, context):
+                requetes.setdefault(sql, {'page': chemin, 'sql': sql, 'params': params})
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(relever):
+                reponse = client.get(chemin) if donnees is None else client.post(chemin, donnees)
+            if reponse.status_code != 200:
+                raise CommandError(f"{chemin} a répondu {reponse.status_code}")
+        return list(requetes.values())
+
+    def handle(self, *args, **options):
+        plan = PLANS.get(connection.vendor)
+        if plan is None:
+            raise CommandError(f"EXPLAIN n'est pris en charge que pour SQLite et MySQL, pas {connection.vendor}.")
+        with transaction.atomic():
+            if options['rejouer']:
+                with open(options['rejouer'], encoding='utf-8') as fichier:
+                    requetes = [json.loads(ligne) for ligne in fichier if ligne.strip()]
+            else:
+                requetes = self._relever(options['utilisateur'])
+            requetes = [requete for requete in requetes if requete['sql'].lstrip().upper().startswith(INSTRUCTIONS)]
+            resultats = []
+            with connection.cursor() as curseur:
+                for requete in requetes:
+                    problemes = plan(curseur, requete['sql'], requete['params'])
+                    if problemes:
+                        resultats.append((requete, problemes))
+            transaction.set_rollback(True)
+        if options['enregistrer']:
+            with open(options['enregistrer'], 'w', encoding='utf-8') as fichier:
+                for requete in requetes:
+                    fichier.write(json.dumps(requete, cls=DjangoJSONEncoder) + '\n')
+        for requete, problemes in resultats:
+            self.stdout.write(self.style.WARNING(requete['page']))
+            for table, probleme in problemes:
+                self.stdout.write(f"    {table or '-'} : {probleme}")
+            sql = requete['sql']
+            self.stdout.write(f"    {sql[:LONGUEUR_SQL]}{'…' if len(sql) > LONGUEUR_SQL else ''}")
+        complets = sum(any(probleme.startswith('parcours') for _, probleme in problemes) for _, problemes in resultats)
+        self.stdout.write(f"{len(requetes)} requête(s) distincte(s) analysée(s), {complets} avec parcours complet.")
+        if not resultats:
+            self.stdout.write(self.style.SUCCESS("Aucun parcours complet ni tri sans index."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api.images import IMAGE_PAR_DEFAUT, generer_renditions
+from api.models import Livre
+
+class Command(BaseCommand):
+    help = "Génère les déclinaisons (tailles et formats) des couvertures qui n'en ont pas encore."
+
+    def handle(self, *args, **options):
+        ids = Livre.objects.exclude(image="").exclude(image=IMAGE_PAR_DEFAUT).values_list('id', flat=True)
+        for nombre, livre_id in enumerate(ids.iterator(), start=1):
+            generer_renditions(livre_id)
+            if nombre % 100 == 0:
+                self.stdout.write(f"{nombre} couverture(s) traitée(s)...")
+        self.stdout.write(self.style.SUCCESS("Déclinaisons générées."))
@@ -0,0 +1,101 @@
+import json
+import os
+import time
+from collections import Counter, deque
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.exceptions import ValidationError
+from api.ingestion import IngestionCatalogue, LECTEURS, SEPARATEUR, TAILLE_LOT, CREE, MIS_A_JOUR, ERREUR, IGNORE
+from api.serializers import LigneCatalogueSerializer
+
+def _erreurs(detail):
+    if isinstance(detail, dict):
+        return '; '.join(f"{champ} : {_erreurs(messages)}" for champ, messages in detail.items())
+    if isinstance(detail, list):
+        return ' '.join(_erreurs(message) for message in detail)
+    return str(detail)
+
+class Command(BaseCommand):
+    help = (
+        "Importe un catalogue (CSV, JSONL ou MARC texte .mrk) par lots transactionnels, sans signaux par livre. "
+        "Les auteurs et les tags sont dédoublonnés par nom et l'import reprend là où il s'est arrêté."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier')
+        parser.add_argument('--format', choices=sorted(LECTEURS), help="Déduit de l'extension par défaut.")
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT)
+        parser.add_argument('--separateur', default=SEPARATEUR, help="Séparateur des auteurs et des tags dans une cellule.")
+        parser.add_argument('--reprise', help="Fichier de reprise (par défaut <fichier>.reprise).")
+        parser.add_argument('--recommencer', action='store_true', help="Ignore le fichier de reprise existant.")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        chemin = options['fichier']
+        format = options['format'] or os.path.splitext(chemin)[1].lstrip('.').lower()
+        if format not in LECTEURS:
+            raise CommandError(f"Format inconnu : {format or '?'} (formats acceptés : {', '.join(sorted(LECTEURS))}).")
+        if options['taille_lot'] < 1:
+            raise CommandError("La taille de lot doit être positive.")
+        if not os.path.isfile(chemin):
+            raise CommandError(f"Fichier introuvable : {chemin}")
+        self.reprise = options['reprise'] or f'{chemin}.reprise'
+        self.etat = {'fichier': os.path.abspath(chemin), 'taille': os.path.getsize(chemin), 'position': 0, CREE: 0, MIS_A_JOUR: 0, ERREUR: 0, IGNORE: 0}
+        if not options['recommencer']:
+            self._lire_reprise()
+        self.debut = time.monotonic()
+        self.depart = self.etat['position']
+        ingestion = IngestionCatalogue(options['database'], options['taille_lot'])
+        validateur = LigneCatalogueSerializer()
+        with open(chemin, encoding='utf-8-sig', newline='') as fichier:
+            enregistrements = enumerate(LECTEURS[format](fichier, options['separateur']), start=1)
+            deque(islice(enregistrements, self.etat['position']), maxlen=0)
+            lot, position = [], self.etat['position']
+            for position, (numero, donnees) in enregistrements:
+                try:
+                    if donnees is None:
+                        raise ValidationError("Enregistrement illisible.")
+                    lot.append(validateur.run_validation(donnees))
+                except ValidationError as erreur:
+                    self.etat[ERREUR] += 1
+                    self.stderr.write(f"Ligne {numero} ignorée : {_erreurs(erreur.detail)}")
+                if len(lot) >= options['taille_lot']:
+                    self._ingerer(ingestion, lot, position)
+                    lot = []
+            self._ingerer(ingestion, lot, position)
+        if os.path.exists(self.reprise):
+            os.remove(self.reprise)
+        self.stdout.write(self.style.SUCCESS(
+            f"Import terminé : {self.etat[CREE]} livre(s) créé(s), {self.etat[MIS_A_JOUR]} mis à jour, "
+            f"{self.etat[IGNORE]} doublon(s) ignoré(s), {self.etat[ERREUR]} erreur(s)."
+        ))
+
+    def _lire_reprise(self):
+        if not os.path.exists(self.reprise):
+            return
+        with open(self.reprise, encoding='utf-8') as fichier:
+            etat = json.load(fichier)
+        if (etat.get('fichier'), etat.get('taille')) != (self.etat['fichier'], self.etat['taille']):
+            raise CommandError(f"{self.reprise} concerne un autre fichier ; relancez avec --recommencer.")
+        self.etat.update(etat)
+        self.stdout.write(f"Reprise après l'enregistrement {self.etat['position']}.")
+
+    def _ecrire_reprise(self):
+        temporaire = f'{self.reprise}.tmp'
+        with open(temporaire, 'w', encoding='utf-8') as fichier:
+            json.dump(self.etat, fichier)
+        os.replace(temporaire, self.reprise)
+
+    def _ingerer(self, ingestion, lot, position):
+        comptes = Counter(resultat['statut'] for resultat in ingestion.ingerer(lot))
+        self.etat[CREE] += comptes[CREE]
+        self.etat[MIS_A_JOUR] += comptes[MIS_A_JOUR]
+        self.etat[IGNORE] += comptes[IGNORE]
+        self.etat['position'] = position
+        self._ecrire_reprise()
+        debit = (position - self.depart) / max(time.monotonic() - self.debut, 1e-6)
+        self.stdout.write(
+            f"{position} enregistrement(s) lu(s) : {self.etat[CREE]} créé(s), {self.etat[MIS_A_JOUR]} mis à jour, "
+            f"{self.etat[IGNORE]} doublon(s), {self.etat[ERREUR]} erreur(s) ({debit:.0f}/s)"
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from api.versions import toucher_livres
+from api.models import recalculer_pour_adulte
+
+class Command(BaseCommand):
+    help = "Recalcule l'indicateur de contenu pour adulte de tous les livres à partir de leurs tags."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            nombre = recalculer_pour_adulte(using=options['database'])
+            toucher_livres(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f"{nombre} livre(s) mis à jour."))
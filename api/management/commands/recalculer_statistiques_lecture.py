@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from api.statistiques import recalculer_rollups
+from api.models import User
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit les statistiques de lecture agrégées (livres et pages par mois, notes par tag et par auteur) "
+        "à partir des lectures, pour tous les lecteurs ou ceux indiqués."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('lecteurs', nargs='*', help="Noms d'utilisateur (tous par défaut).")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        lecteurs = None
+        if options['lecteurs']:
+            lecteurs = dict(User.objects.using(using).filter(username__in=options['lecteurs']).values_list('username', 'id'))
+            inconnus = sorted(set(options['lecteurs']) - set(lecteurs))
+            if inconnus:
+                raise CommandError(f"Utilisateur(s) introuvable(s) : {', '.join(inconnus)}")
+            lecteurs = list(lecteurs.values())
+        nombre = recalculer_rollups(lecteurs, using)
+        self.stdout.write(self.style.SUCCESS(f"{nombre} mois de lecture recalculé(s)."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from api.versions import toucher_livres
+from api.models import recalculer_statistiques
+
+class Command(BaseCommand):
+    help = "Recalcule les statistiques de notes et de lectures stockées sur chaque livre."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            nombre = recalculer_statistiques(using=options['database'])
+            toucher_livres(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f"{nombre} livre(s) mis à jour."))
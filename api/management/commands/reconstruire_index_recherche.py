@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from api.recherche import reconstruire_index
+
+class Command(BaseCommand):
+    help = "Reconstruit entièrement l'index de recherche plein texte du catalogue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        nombre = reconstruire_index(options['database'])
+        self.stdout.write(self.style.SUCCESS(f"{nombre} livre(s) indexé(s)."))
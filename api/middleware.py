@@ -0,0 +1,16 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject
+from .utils import PolitiqueContenu
+
+class PolitiqueContenuMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.politique_contenu = SimpleLazyObject(lambda: PolitiqueContenu(request.user))
+        return self.get_response(request)
@@ -3,10 +3,15 @@ from django.contrib.auth.models import AbstractUser
 from django.contrib.auth import get_user_model
 import os
 from django.utils.timezone import now
-from PIL import Image
 from django.dispatch import receiver
-from django.db.models.signals import pre_delete, pre_save
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete, m2m_changed
+from django.db.models import Exists, OuterRef, Subquery, F, Case, When, Value, Count, Sum, Avg, FloatField
+from django.db.models.functions import Cast, Coalesce, Lower
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
+from django.core.files.storage import default_storage
+from .utils import politique_contenu
+from .images import IMAGE_PAR_DEFAUT, planifier_renditions, supprimer_renditions
 
 class Auteur(models.Model):
     nom = models.CharField(max_length=100)
@@ -18,6 +23,10 @@ class Auteur(models.Model):
         return self.nom
     
     class Meta:
+        indexes = [
+            models.Index(fields=['nom', 'id'], name='auteur_nom_id_idx'),
+            models.Index(Lower('nom'), name='auteur_nom_lower_idx'),
+        ]
         permissions = (
             ("creer_auteur", "Peut créer un auteur."),
             ("modifier_auteur", "Peut modifier un auteur."),
@@ -29,16 +38,41 @@ class Tag(models.Model):
     pour_adulte = models.BooleanField()
     modifiable = models.BooleanField(default=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._pour_adulte_initial = instance.__dict__.get('pour_adulte')
+        return instance
+
     def __str__(self):
         return self.tag
     
     class Meta:
+        indexes = [
+            models.Index(fields=['tag', 'id'], name='tag_tag_id_idx'),
+            models.Index(Lower('tag'), name='tag_tag_lower_idx'),
+        ]
         permissions = (
             ('creer_tag', 'Peut créer un tag.'),
             ('modifier_tag', 'Peut modifier un tag.'),
             ('supprimer_tag', 'Peut supprimer un tag.'),
         )
 
+class LivresVisiblesManager(models.Manager):
+    def pour(self, request):
+        queryset = self.get_queryset()
+        if not politique_contenu(request).voir_pour_adulte:
+            queryset = queryset.filter(est_pour_adulte=False)
+        return queryset
+
+class Version(models.Model):
+    cle = models.CharField(max_length=100, unique=True)
+    numero = models.PositiveBigIntegerField(default=0)
+    modifie_le = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return f"{self.cle} ({self.numero})"
+
 def renommer_image(instance, filename):
         extension = os.path.splitext(filename)[1]
         nouveau_nom = f"{instance.id}_{instance.nom}_{now().strftime('%Y%m%d%H%M%S')}{extension}"
@@ -61,45 +95,151 @@ class Livre(models.Model):
         default="default.png",
         blank=True
     )
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+    est_pour_adulte = models.BooleanField(default=False, db_index=True, editable=False)
+    nombre_lectures = models.PositiveIntegerField(default=0, editable=False)
+    nombre_notes = models.PositiveIntegerField(default=0, editable=False)
+    somme_notes = models.PositiveIntegerField(default=0, editable=False)
+    notes_1 = models.PositiveIntegerField(default=0, editable=False)
+    notes_2 = models.PositiveIntegerField(default=0, editable=False)
+    notes_3 = models.PositiveIntegerField(default=0, editable=False)
+    notes_4 = models.PositiveIntegerField(default=0, editable=False)
+    notes_5 = models.PositiveIntegerField(default=0, editable=False)
+    moyenne_notes = models.FloatField(null=True, blank=True, editable=False)
 
     auteurs = models.ManyToManyField(Auteur)
     tags = models.ManyToManyField(Tag)
 
+    objects = models.Manager()
+    visibles = LivresVisiblesManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in instance.__dict__:
+            instance._image_initiale = instance.__dict__['image']
+        if 'nombre_pages' in instance.__dict__:
+            instance._nombre_pages_initial = instance.__dict__['nombre_pages']
+        if 'nom' in instance.__dict__ and 'est_pour_adulte' in instance.__dict__:
+            instance._libelle_initial = (instance.nom, instance.est_pour_adulte)
+        return instance
+
+    @property
+    def image_modifiee(self):
+        if self.pk is None or not hasattr(self, '_image_initiale'):
+            return True
+        return not self.image._committed or self.image.name != self._image_initiale
+
+    @property
+    def libelle_modifie(self):
+        return getattr(self, '_libelle_initial', None) != (self.nom, self.est_pour_adulte)
+
     def save(self, *args, **kwargs):
+        image_modifiee = self.image_modifiee
         super().save(*args, **kwargs)
-        if self.image:
-            img_path = self.image.path
-            with Image.open(img_path) as img:
-                max_size = (800, 1200)
-                img.thumbnail(max_size)
-                img.save(img_path)
+        if image_modifiee and self.image and self.image.name != IMAGE_PAR_DEFAUT:
+            planifier_renditions(self)
+        self._image_initiale = self.image.name
+        self._libelle_initial = (self.nom, self.est_pour_adulte)
+
+    @property
+    def histogramme_notes(self):
+        return {note: getattr(self, f'notes_{note}') for note in range(1, 6)}
 
     def __str__(self):
         return self.nom
 
     class Meta:
+        indexes = [
+            models.Index(fields=['nom', 'id'], name='livre_nom_id_idx'),
+            models.Index(fields=['-moyenne_notes', '-id'], name='livre_moyenne_id_idx'),
+            models.Index(fields=['-nombre_lectures', '-id'], name='livre_lectures_id_idx'),
+        ]
         permissions = (
             ('creer_livre', 'Peut créer un livre.'),
             ('modifier_livre', 'Peut modifier un livre.'),
             ('suppression_livre', 'Peut supprimer un livre.')
         )
 
+class LivreRecherche(models.Model):
+    livre = models.OneToOneField(
+        Livre, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', db_constraint=False, related_name='recherche'
+    )
+    nom = models.TextField()
+    auteurs = models.TextField()
+    tags = models.TextField()
+    synopsis = models.TextField()
+    edition = models.TextField()
+    isbn = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'api_livre_recherche'
+
 @receiver(pre_delete, sender=Livre)
 def supprimer_image_livre(sender, instance, **kwargs):
-    if instance.image and instance.image.name != "default.png":
+    if instance.image and instance.image.name != IMAGE_PAR_DEFAUT:
         if os.path.isfile(instance.image.path):
             os.remove(instance.image.path)
+    supprimer_renditions(instance.renditions)
 
 @receiver(pre_save, sender=Livre)
 def remplacer_image_livre(sender, instance, **kwargs):
-    if instance.pk:
-        try:
-            ancien_livre = Livre.objects.get(pk=instance.pk)
-            if ancien_livre.image and ancien_livre.image.name != "default.png" and (not instance.image or ancien_livre.image != instance.image):
-                if os.path.isfile(ancien_livre.image.path):
-                    os.remove(ancien_livre.image.path)
-        except Livre.DoesNotExist:
-            pass
+    if not instance.pk or not instance.image_modifiee:
+        return
+    if hasattr(instance, '_image_initiale'):
+        ancienne_image, anciennes_renditions = instance._image_initiale, instance.renditions
+    else:
+        ancien_livre = Livre.objects.filter(pk=instance.pk).values('image', 'renditions').first()
+        if ancien_livre is None:
+            return
+        ancienne_image, anciennes_renditions = ancien_livre['image'], ancien_livre['renditions']
+    if ancienne_image and ancienne_image != IMAGE_PAR_DEFAUT and (not instance.image or ancienne_image != instance.image.name):
+        chemin = default_storage.path(ancienne_image)
+        if os.path.isfile(chemin):
+            os.remove(chemin)
+        supprimer_renditions(anciennes_renditions)
+        instance.renditions = {}
+
+def _a_tag_pour_adulte():
+    return Exists(Livre.tags.through.objects.filter(livre_id=OuterRef('pk'), tag__pour_adulte=True))
+
+def recalculer_pour_adulte(ids=None, using='default'):
+    from .versions import incrementer_versions, AUTOCOMPLETION_LIVRE
+    livres = Livre.objects.using(using).exclude(est_pour_adulte=_a_tag_pour_adulte())
+    if ids is not None:
+        livres = livres.filter(id__in=list(ids))
+    nombre = livres.update(est_pour_adulte=_a_tag_pour_adulte())
+    if nombre:
+        incrementer_versions([AUTOCOMPLETION_LIVRE], using)
+    return nombre
+
+@receiver(m2m_changed, sender=Livre.tags.through)
+def maj_pour_adulte_tags_livre(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            recalculer_pour_adulte([instance.pk], using)
+    elif action == 'pre_clear':
+        instance._livres_pour_adulte = list(instance.livre_set.using(using).values_list('id', flat=True))
+    elif action == 'post_clear':
+        recalculer_pour_adulte(getattr(instance, '_livres_pour_adulte', []), using)
+    elif action.startswith('post_'):
+        recalculer_pour_adulte(pk_set, using)
+
+@receiver(post_save, sender=Tag)
+def maj_pour_adulte_tag(sender, instance, created, using, **kwargs):
+    if not created and getattr(instance, '_pour_adulte_initial', None) != instance.pour_adulte:
+        recalculer_pour_adulte(instance.livre_set.using(using).values_list('id', flat=True), using)
+    instance._pour_adulte_initial = instance.pour_adulte
+
+@receiver(pre_delete, sender=Tag)
+def memoriser_livres_tag_pour_adulte(sender, instance, using, **kwargs):
+    if instance.pour_adulte:
+        instance._livres_pour_adulte = list(instance.livre_set.using(using).values_list('id', flat=True))
+
+@receiver(post_delete, sender=Tag)
+def maj_pour_adulte_tag_supprime(sender, instance, using, **kwargs):
+    recalculer_pour_adulte(getattr(instance, '_livres_pour_adulte', []), using)
 
 class User(AbstractUser):
     date_naissance = models.DateField()
@@ -130,6 +270,7 @@ class Lecture(models.Model):
         verbose_name="Note"
     )
     marque_pages = models.PositiveIntegerField(null=True, blank=True)
+    marque_pages_horodatage = models.DateTimeField(null=True, blank=True, editable=False)
     commentaire = models.TextField(null=True, blank=True)
 
     livre = models.ForeignKey(Livre, on_delete=models.CASCADE)
@@ -139,8 +280,154 @@ class Lecture(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['livre', 'lecteur'], name='unique_livre_lecteur')
         ]
+        indexes = [
+            models.Index(fields=['lecteur', 'statut'], name='lecture_lecteur_statut_idx'),
+            models.Index(fields=['livre', 'note'], name='lecture_livre_note_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._etat_statistiques = instance.etat_statistiques()
+        instance._etat_rollups = instance.etat_rollups()
+        instance._marque_pages_initial = instance.__dict__.get('marque_pages')
+        return instance
+
+    def clean(self):
+        if self.marque_pages is not None and self.livre_id and self.marque_pages > self.livre.nombre_pages:
+            raise ValidationError({'marque_pages': f"Le livre ne compte que {self.livre.nombre_pages} pages."})
+
+    def etat_statistiques(self):
+        return (self.__dict__.get('livre_id'), self.__dict__.get('statut'), self.__dict__.get('note'))
+
+    def etat_rollups(self):
+        return (self.__dict__.get('lecteur_id'), *self.etat_statistiques(), self.__dict__.get('date_debut'), self.__dict__.get('date_fin'))
 
     def save(self, *args, **kwargs):
         if self.statut == 'lu' and self.livre and hasattr(self.livre, 'nombre_pages'):
             self.marque_pages = self.livre.nombre_pages
+        update_fields = kwargs.get('update_fields')
+        if self.marque_pages != getattr(self, '_marque_pages_initial', None) and (update_fields is None or 'marque_pages' in update_fields):
+            self.marque_pages_horodatage = now()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'marque_pages_horodatage'}
         super().save(*args, **kwargs)
+        self._marque_pages_initial = self.marque_pages
+
+
+class Recommandation(models.Model):
+    TYPE_CHOICES = [
+        ('lecteurs', 'Les lecteurs qui ont aimé ce livre ont aussi aimé'),
+        ('tags', 'Avec les mêmes tags et auteurs'),
+    ]
+
+    livre = models.ForeignKey(Livre, on_delete=models.CASCADE, related_name='recommandations')
+    recommande = models.ForeignKey(Livre, on_delete=models.CASCADE, related_name='+')
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    rang = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['livre', 'type', 'rang'], name='recommandation_livre_rang')
+        ]
+
+class StatistiqueMensuelle(models.Model):
+    lecteur = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    mois = models.DateField()
+    livres_lus = models.PositiveIntegerField(default=0)
+    pages_lues = models.PositiveIntegerField(default=0)
+    pages_chronometrees = models.PositiveIntegerField(default=0)
+    jours_lecture = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lecteur', 'mois'], name='unique_statistique_mensuelle')
+        ]
+
+class StatistiqueTag(models.Model):
+    lecteur = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    nombre_notes = models.PositiveIntegerField(default=0)
+    somme_notes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lecteur', 'tag'], name='unique_statistique_tag')
+        ]
+
+class StatistiqueAuteur(models.Model):
+    lecteur = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    auteur = models.ForeignKey(Auteur, on_delete=models.CASCADE)
+    nombre_notes = models.PositiveIntegerField(default=0)
+    somme_notes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lecteur', 'auteur'], name='unique_statistique_auteur')
+        ]
+
+def _contribution_statistiques(statut, note):
+    contribution = {}
+    if statut == 'lu':
+        contribution['nombre_lectures'] = 1
+    if note:
+        contribution.update({'nombre_notes': 1, 'somme_notes': note, f'notes_{note}': 1})
+    return contribution
+
+def _appliquer_statistiques(livre_id, deltas, using):
+    deltas = {champ: valeur for champ, valeur in deltas.items() if valeur}
+    if not livre_id or not deltas:
+        return
+    livres = Livre.objects.using(using).filter(pk=livre_id)
+    livres.update(**{champ: F(champ) + valeur for champ, valeur in deltas.items()})
+    if 'nombre_notes' in deltas or 'somme_notes' in deltas:
+        livres.update(moyenne_notes=Case(
+            When(nombre_notes=0, then=Value(None)),
+            default=Cast(F('somme_notes'), FloatField()) / F('nombre_notes'),
+            output_field=FloatField()
+        ))
+
+def recalculer_statistiques(ids=None, using='default'):
+    livres = Livre.objects.using(using)
+    if ids is not None:
+        livres = livres.filter(id__in=list(ids))
+    lectures = Lecture.objects.using(using).filter(livre=OuterRef('pk')).order_by().values('livre')
+    notes = lectures.filter(note__isnull=False)
+
+    def compter(queryset):
+        return Coalesce(Subquery(queryset.annotate(nombre=Count('id')).values('nombre')), 0)
+
+    valeurs = {
+        'nombre_lectures': compter(lectures.filter(statut='lu')),
+        'nombre_notes': compter(notes),
+        'somme_notes': Coalesce(Subquery(notes.annotate(somme=Sum('note')).values('somme')), 0),
+        'moyenne_notes': Subquery(notes.annotate(moyenne=Avg('note')).values('moyenne')),
+    }
+    valeurs.update({f'notes_{note}': compter(notes.filter(note=note)) for note in range(1, 6)})
+    return livres.update(**valeurs)
+
+@receiver(post_save, sender=Lecture)
+def maj_statistiques_lecture(sender, instance, created, using, **kwargs):
+    livre_id, statut, note = instance.etat_statistiques()
+    if created:
+        _appliquer_statistiques(livre_id, _contribution_statistiques(statut, note), using)
+    elif not hasattr(instance, '_etat_statistiques'):
+        recalculer_statistiques([livre_id], using)
+    else:
+        ancien_livre_id, ancien_statut, ancienne_note = instance._etat_statistiques
+        ancienne = _contribution_statistiques(ancien_statut, ancienne_note)
+        nouvelle = _contribution_statistiques(statut, note)
+        if ancien_livre_id == livre_id:
+            champs = set(ancienne) | set(nouvelle)
+            _appliquer_statistiques(livre_id, {champ: nouvelle.get(champ, 0) - ancienne.get(champ, 0) for champ in champs}, using)
+        else:
+            _appliquer_statistiques(ancien_livre_id, {champ: -valeur for champ, valeur in ancienne.items()}, using)
+            _appliquer_statistiques(livre_id, nouvelle, using)
+    instance._etat_statistiques = (livre_id, statut, note)
+
+@receiver(post_delete, sender=Lecture)
+def maj_statistiques_lecture_supprimee(sender, instance, using, **kwargs):
+    livre_id, statut, note = getattr(instance, '_etat_statistiques', instance.etat_statistiques())
+    contribution = _contribution_statistiques(statut, note)
+    _appliquer_statistiques(livre_id, {champ: -valeur for champ, valeur in contribution.items()}, using)
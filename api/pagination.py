@@ -0,0 +1,7 @@
+from rest_framework.pagination import CursorPagination
+
+class PaginationCurseur(CursorPagination):
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'taille'
+    max_page_size = 500
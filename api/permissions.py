@@ -0,0 +1,5 @@
+from rest_framework.permissions import BasePermission
+
+class PeutImporterLivres(BasePermission):
+    def has_permission(self, request, view):
+        return request.user.has_perms(['api.creer_livre', 'api.modifier_livre'])
@@ -0,0 +1,239 @@
+import re
+import unicodedata
+from collections import defaultdict
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import Q, Exists, F, FloatField, Func, Lookup, OuterRef, Value
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Livre, LivreRecherche, Auteur, Tag
+
+TABLE_RECHERCHE = LivreRecherche._meta.db_table
+TAILLE_LOT = 500
+COLONNES = ('nom', 'auteurs', 'tags', 'synopsis', 'edition', 'isbn')
+POIDS_SQLITE = (10.0, 6.0, 4.0, 1.0, 2.0, 8.0)
+
+def normaliser(texte):
+    texte = unicodedata.normalize('NFKD', texte or '')
+    return ''.join(c for c in texte if not unicodedata.combining(c)).lower()
+
+def _termes(texte):
+    return re.findall(r'\w+', normaliser(texte))
+
+def _connexion(using):
+    connexion = connections[using or DEFAULT_DB_ALIAS]
+    if connexion.vendor in ('sqlite', 'mysql'):
+        return connexion
+    return None
+
+def creer_table_recherche(using=DEFAULT_DB_ALIAS, **kwargs):
+    connexion = _connexion(using)
+    if connexion is None:
+        return
+    with connexion.cursor() as curseur:
+        if connexion.vendor == 'sqlite':
+            curseur.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE_RECHERCHE} "
+                f"USING fts5({', '.join(COLONNES)}, tokenize='unicode61 remove_diacritics 2')"
+            )
+        else:
+            curseur.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE_RECHERCHE} ("
+                "rowid BIGINT PRIMARY KEY, "
+                "nom VARCHAR(255), auteurs TEXT, tags TEXT, synopsis LONGTEXT, "
+                "edition VARCHAR(255), isbn VARCHAR(100), "
+                f"FULLTEXT KEY {TABLE_RECHERCHE}_nom (nom), "
+                f"FULLTEXT KEY {TABLE_RECHERCHE}_tout ({', '.join(COLONNES)})"
+                ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+            )
+
+def indexer_livres(ids, using=DEFAULT_DB_ALIAS, remplacer=True):
+    connexion = _connexion(using)
+    ids = list(ids)
+    if connexion is None or not ids:
+        return
+    for debut in range(0, len(ids), TAILLE_LOT):
+        lot = ids[debut:debut + TAILLE_LOT]
+        auteurs, tags = defaultdict(list), defaultdict(list)
+        for livre_id, nom in Livre.auteurs.through.objects.using(using).filter(livre_id__in=lot).values_list('livre_id', 'auteur__nom'):
+            auteurs[livre_id].append(nom)
+        for livre_id, nom in Livre.tags.through.objects.using(using).filter(livre_id__in=lot).values_list('livre_id', 'tag__tag'):
+            tags[livre_id].append(nom)
+        livres = Livre.objects.using(using).filter(id__in=lot).values_list('id', 'nom', 'synopsis', 'edition', 'isbn')
+        lignes = [
+            (
+                livre_id,
+                normaliser(nom),
+                normaliser(' '.join(auteurs[livre_id])),
+                normaliser(' '.join(tags[livre_id])),
+                normaliser(synopsis),
+                normaliser(edition),
+                isbn or '',
+            )
+            for livre_id, nom, synopsis, edition, isbn in livres
+        ]
+        with connexion.cursor() as curseur:
+            if remplacer:
+                curseur.execute(
+                    f"DELETE FROM {TABLE_RECHERCHE} WHERE rowid IN ({', '.join(['%s'] * len(lot))})",
+                    lot
+                )
+            if lignes:
+                curseur.executemany(
+                    f"INSERT INTO {TABLE_RECHERCHE} (rowid, {', '.join(COLONNES)}) "
+                    f"VALUES ({', '.join(['%s'] * (len(COLONNES) + 1))})",
+                    lignes
+                )
+
+def reconstruire_index(using=DEFAULT_DB_ALIAS):
+    connexion = _connexion(using)
+    if connexion is None:
+        return 0
+    with connexion.cursor() as curseur:
+        curseur.execute(f"DROP TABLE IF EXISTS {TABLE_RECHERCHE}")
+    creer_table_recherche(using)
+    ids = list(Livre.objects.using(using).order_by('id').values_list('id', flat=True))
+    indexer_livres(ids, using, remplacer=False)
+    return len(ids)
+
+def _table(expression, compiler):
+    return compiler.quote_name_unless_alias(expression.alias)
+
+def _colonnes(table, connection):
+    return ', '.join(f'{table}.{connection.ops.quote_name(colonne)}' for colonne in COLONNES)
+
+class _Correspondance(Lookup):
+    lookup_name = 'correspond'
+
+    def as_sqlite(self, compiler, connection):
+        rhs, params = self.process_rhs(compiler, connection)
+        return f'{_table(self.lhs, compiler)} MATCH {rhs}', params
+
+    def as_mysql(self, compiler, connection):
+        rhs, params = self.process_rhs(compiler, connection)
+        return f'MATCH({_colonnes(_table(self.lhs, compiler), connection)}) AGAINST ({rhs} IN BOOLEAN MODE)', params
+
+class _Pertinence(Func):
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection):
+        table = _table(self.source_expressions[0], compiler)
+        return f"-bm25({table}, {', '.join(str(p) for p in POIDS_SQLITE)})", []
+
+    def as_mysql(self, compiler, connection):
+        colonne, expression = self.source_expressions
+        table = _table(colonne, compiler)
+        rhs, params = compiler.compile(expression)
+        return (
+            f'MATCH({table}.{connection.ops.quote_name("nom")}) AGAINST ({rhs} IN BOOLEAN MODE) * 3 '
+            f'+ MATCH({_colonnes(table, connection)}) AGAINST ({rhs} IN BOOLEAN MODE)',
+            params * 2
+        )
+
+LivreRecherche._meta.get_field('nom').register_lookup(_Correspondance)
+
+def rechercher_livres(queryset, texte):
+    termes = _termes(texte)
+    if not termes:
+        return queryset
+    connexion = _connexion(queryset.db)
+    if connexion is None:
+        return queryset.filter(
+            Q(nom__icontains=texte) | Q(synopsis__icontains=texte) | Q(edition__icontains=texte)
+            | Q(isbn__icontains=texte)
+            | Exists(Livre.auteurs.through.objects.filter(livre_id=OuterRef('pk'), auteur__nom__icontains=texte))
+            | Exists(Livre.tags.through.objects.filter(livre_id=OuterRef('pk'), tag__tag__icontains=texte))
+        )
+    if connexion.vendor == 'sqlite':
+        expression = ' '.join(f'"{terme}"*' for terme in termes)
+    else:
+        expression = ' '.join(f'+{terme}*' for terme in termes)
+    return queryset.filter(recherche__nom__correspond=expression).annotate(
+        pertinence=_Pertinence(F('recherche__nom'), Value(expression))
+    ).order_by('-pertinence', 'id')
+
+class RechercheLivres:
+    ET = 'et'
+    OU = 'ou'
+    TRIS = {
+        'mieux_notes': ('-moyenne_notes', '-id'),
+        'plus_lus': ('-nombre_lectures', '-id'),
+    }
+
+    def __init__(self, texte='', tags=(), mode_tags=ET, auteur=None, tri=''):
+        self.texte = texte or ''
+        self.tags = list(tags or ())
+        self.mode_tags = mode_tags or self.ET
+        self.auteur = auteur
+        self.tri = tri if tri in self.TRIS else ''
+
+    @property
+    def par_pertinence(self):
+        return bool(_termes(self.texte))
+
+    @property
+    def par_nom(self):
+        return not self.tri and not self.par_pertinence
+
+    @property
+    def champ_curseur(self):
+        if self.tri:
+            return self.TRIS[self.tri][0]
+        return 'nom' if self.par_nom else None
+
+    def _filtre_tags(self):
+        through = Livre.tags.through.objects
+        if self.mode_tags == self.OU:
+            return [Exists(through.filter(livre_id=OuterRef('pk'), tag_id__in=[tag.pk for tag in self.tags]))]
+        return [Exists(through.filter(livre_id=OuterRef('pk'), tag_id=tag.pk)) for tag in self.tags]
+
+    def appliquer(self, queryset=None):
+        if queryset is None:
+            queryset = Livre.objects.all()
+        conditions = []
+        if self.tags:
+            conditions.extend(self._filtre_tags())
+        if self.auteur:
+            conditions.append(Exists(Livre.auteurs.through.objects.filter(livre_id=OuterRef('pk'), auteur_id=self.auteur.pk)))
+        if conditions:
+            queryset = queryset.filter(*conditions)
+        if self.par_pertinence:
+            queryset = rechercher_livres(queryset, self.texte)
+        if self.tri:
+            return queryset.order_by(*self.TRIS[self.tri])
+        if self.par_nom:
+            return queryset.order_by('nom', 'id')
+        return queryset
+
+@receiver(post_save, sender=Livre)
+@receiver(post_delete, sender=Livre)
+def indexer_livre(sender, instance, using, **kwargs):
+    indexer_livres([instance.pk], using)
+
+@receiver(m2m_changed, sender=Livre.auteurs.through)
+@receiver(m2m_changed, sender=Livre.tags.through)
+def indexer_relations_livre(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            indexer_livres([instance.pk], using)
+    elif action == 'pre_clear':
+        instance._livres_a_indexer = list(instance.livre_set.using(using).values_list('id', flat=True))
+    elif action == 'post_clear':
+        indexer_livres(getattr(instance, '_livres_a_indexer', []), using)
+    elif action.startswith('post_'):
+        indexer_livres(pk_set, using)
+
+@receiver(post_save, sender=Auteur)
+@receiver(post_save, sender=Tag)
+def indexer_livres_lies(sender, instance, created, using, **kwargs):
+    if not created:
+        indexer_livres(instance.livre_set.using(using).values_list('id', flat=True), using)
+
+@receiver(pre_delete, sender=Auteur)
+@receiver(pre_delete, sender=Tag)
+def memoriser_livres_lies(sender, instance, using, **kwargs):
+    instance._livres_a_indexer = list(instance.livre_set.using(using).values_list('id', flat=True))
+
+@receiver(post_delete, sender=Auteur)
+@receiver(post_delete, sender=Tag)
+def reindexer_livres_lies(sender, instance, using, **kwargs):
+    indexer_livres(getattr(instance, '_livres_a_indexer', []), using)
@@ -0,0 +1,110 @@
+import numpy as np
+from django.db import DEFAULT_DB_ALIAS, transaction
+from .models import Livre, Lecture, Recommandation
+
+K = 10
+TAILLE_BLOC = 64
+TAILLE_LOT = 5000
+NOTE_NEUTRE = 3
+RETRECISSEMENT = 5
+FREQUENCE_MAX = 0.5
+
+def _segments(debuts, longueurs):
+    decalages = np.repeat(debuts - np.cumsum(longueurs) + longueurs, longueurs)
+    return decalages + np.arange(longueurs.sum())
+
+def _par_ligne(lignes, colonnes, valeurs, nombre_lignes):
+    ordre = np.argsort(lignes, kind='stable')
+    indptr = np.zeros(nombre_lignes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(lignes, minlength=nombre_lignes), out=indptr[1:])
+    return indptr, colonnes[ordre], valeurs[ordre]
+
+def voisins(lignes, colonnes, valeurs, nombre_lignes, k=K, retrecissement=0, taille_bloc=TAILLE_BLOC):
+    k = min(k, nombre_lignes - 1)
+    if k < 1 or not len(lignes):
+        return
+    nombre_colonnes = int(colonnes.max()) + 1
+    normes = np.sqrt(np.bincount(lignes, weights=valeurs ** 2, minlength=nombre_lignes))
+    inverses = np.divide(1.0, normes, out=np.zeros_like(normes), where=normes > 0)
+    opposes = -inverses
+    indptr, colonnes_par_ligne, valeurs_par_ligne = _par_ligne(lignes, colonnes, valeurs, nombre_lignes)
+    indptr_colonnes, lignes_par_colonne, valeurs_par_colonne = _par_ligne(colonnes, lignes, valeurs, nombre_colonnes)
+    for debut in range(0, nombre_lignes, taille_bloc):
+        fin = min(debut + taille_bloc, nombre_lignes)
+        taille = fin - debut
+        longueurs = np.diff(indptr[debut:fin + 1])
+        entrees = _segments(indptr[debut:fin], longueurs)
+        sources = np.repeat(np.arange(taille), longueurs)
+        colonnes_bloc = colonnes_par_ligne[entrees]
+        longueurs = indptr_colonnes[colonnes_bloc + 1] - indptr_colonnes[colonnes_bloc]
+        cibles = _segments(indptr_colonnes[colonnes_bloc], longueurs)
+        cles = np.repeat(sources, longueurs) * nombre_lignes + lignes_par_colonne[cibles]
+        poids = np.repeat(valeurs_par_ligne[entrees], longueurs) * valeurs_par_colonne[cibles]
+        scores = np.bincount(cles, weights=poids, minlength=taille * nombre_lignes).reshape(taille, nombre_lignes)
+        scores *= opposes
+        if retrecissement:
+            communs = np.bincount(cles, minlength=taille * nombre_lignes).reshape(taille, nombre_lignes)
+            scores *= communs / (communs + retrecissement)
+        scores[np.arange(taille), np.arange(debut, fin)] = 0
+        meilleurs = np.argpartition(scores, k - 1, axis=1)[:, :k]
+        meilleurs_scores = np.take_along_axis(scores, meilleurs, axis=1)
+        ordre = np.argsort(meilleurs_scores, axis=1, kind='stable')
+        meilleurs = np.take_along_axis(meilleurs, ordre, axis=1)
+        meilleurs_scores = np.take_along_axis(meilleurs_scores, ordre, axis=1) * -inverses[debut:fin, None]
+        for ligne in range(taille):
+            retenus = meilleurs_scores[ligne] > 0
+            yield debut + ligne, meilleurs[ligne][retenus], meilleurs_scores[ligne][retenus]
+
+def _tableau(valeurs, colonnes):
+    return np.fromiter(valeurs, dtype=[(colonne, np.float64 if colonne == 'valeur' else np.int64) for colonne in colonnes])
+
+def matrice_lecteurs(using=DEFAULT_DB_ALIAS):
+    notes = _tableau(
+        Lecture.objects.using(using).filter(note__isnull=False).values_list('livre_id', 'lecteur_id', 'note').iterator(chunk_size=TAILLE_LOT),
+        ('livre', 'colonne', 'valeur')
+    )
+    livres, lignes = np.unique(notes['livre'], return_inverse=True)
+    _, colonnes = np.unique(notes['colonne'], return_inverse=True)
+    return livres, lignes, colonnes, notes['valeur'] - NOTE_NEUTRE
+
+def matrice_tags(using=DEFAULT_DB_ALIAS):
+    livres, colonnes, decalage = [], [], 0
+    for relation, colonne in ((Livre.tags.through, 'tag_id'), (Livre.auteurs.through, 'auteur_id')):
+        liens = _tableau(relation.objects.using(using).values_list('livre_id', colonne).iterator(chunk_size=TAILLE_LOT), ('livre', 'colonne'))
+        identifiants, indices = np.unique(liens['colonne'], return_inverse=True)
+        livres.append(liens['livre'])
+        colonnes.append(indices + decalage)
+        decalage += len(identifiants)
+    livres, lignes = np.unique(np.concatenate(livres), return_inverse=True)
+    colonnes = np.concatenate(colonnes)
+    frequences = np.bincount(colonnes)
+    idf = np.log(len(livres) / np.maximum(frequences, 1))
+    gardees = frequences[colonnes] <= FREQUENCE_MAX * len(livres)
+    return livres, lignes[gardees], colonnes[gardees], idf[colonnes[gardees]]
+
+MATRICES = {
+    'lecteurs': (matrice_lecteurs, RETRECISSEMENT),
+    'tags': (matrice_tags, 0),
+}
+
+def calculer_recommandations(type, k=K, using=DEFAULT_DB_ALIAS):
+    construire, retrecissement = MATRICES[type]
+    livres, lignes, colonnes, valeurs = construire(using)
+    recommandations = Recommandation.objects.using(using)
+    nombre = 0
+    with transaction.atomic(using=using):
+        recommandations.filter(type=type).delete()
+        lot = []
+        for ligne, voisins_ligne, scores in voisins(lignes, colonnes, valeurs, len(livres), k, retrecissement):
+            livre_id = int(livres[ligne])
+            lot.extend(
+                Recommandation(livre_id=livre_id, recommande_id=int(livres[voisin]), type=type, rang=rang, score=float(score))
+                for rang, (voisin, score) in enumerate(zip(voisins_ligne, scores))
+            )
+            if len(lot) >= TAILLE_LOT:
+                recommandations.bulk_create(lot)
+                nombre += len(lot)
+                lot = []
+        recommandations.bulk_create(lot)
+        nombre += len(lot)
+    return nombre
@@ -1,33 +1,84 @@
+from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 from .models import *
 
-class AuteurSerializer(ModelSerializer):
+def lire_liste(request, parametre):
+    valeur = request.query_params.get(parametre) if request is not None else None
+    if not valeur:
+        return None
+    return {nom.strip() for nom in valeur.split(',') if nom.strip()}
+
+def sous_expansions(etendre, nom):
+    return {chemin[len(nom) + 1:] for chemin in etendre or () if chemin.startswith(f'{nom}.')}
+
+def est_etendu(etendre, nom):
+    return any(chemin == nom or chemin.startswith(f'{nom}.') for chemin in etendre or ())
+
+def est_inclus(champs, nom):
+    return champs is None or nom in champs
+
+class ChampsDynamiquesMixin:
+    expansions = {}
+
+    def __init__(self, *args, champs=None, etendre=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = kwargs.get('context', {}).get('request')
+        if champs is None:
+            champs = lire_liste(request, 'fields')
+        if etendre is None:
+            etendre = lire_liste(request, 'expand')
+        if champs is not None:
+            for nom in set(self.fields) - champs:
+                self.fields.pop(nom)
+        for nom, (classe, options) in self.expansions.items():
+            if nom in self.fields and est_etendu(etendre, nom):
+                self.fields[nom] = classe(read_only=True, etendre=sous_expansions(etendre, nom), **options)
+
+class AuteurSerializer(ChampsDynamiquesMixin, ModelSerializer):
     class Meta:
         model = Auteur
         fields = '__all__'
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(ChampsDynamiquesMixin, ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(ChampsDynamiquesMixin, ModelSerializer):
     class Meta:
         model = User
         fields = '__all__'
 
-class LivreSerializer(ModelSerializer):
-    auteurs = AuteurSerializer(many=True, read_only=True)
-    tags = TagSerializer(many=True, read_only=True)
+class LivreSerializer(ChampsDynamiquesMixin, ModelSerializer):
+    expansions = {
+        'auteurs': (AuteurSerializer, {'many': True}),
+        'tags': (TagSerializer, {'many': True}),
+    }
 
     class Meta:
         model = Livre
         fields = '__all__'
 
-class LectureSerializer(ModelSerializer):
-    livre = LivreSerializer(read_only=True)
-    lecteur = UserSerializer(read_only=True)
+UserSerializer.expansions = {
+    'liste_de_souhaits': (LivreSerializer, {'many': True}),
+}
+
+class LectureSerializer(ChampsDynamiquesMixin, ModelSerializer):
+    expansions = {
+        'livre': (LivreSerializer, {}),
+        'lecteur': (UserSerializer, {}),
+    }
 
     class Meta:
         model = Lecture
         fields = '__all__'
+
+class LigneCatalogueSerializer(serializers.Serializer):
+    isbn = serializers.RegexField(r'^\d+$', max_length=100)
+    nom = serializers.CharField(max_length=100)
+    date_sortie = serializers.DateField()
+    nombre_pages = serializers.IntegerField()
+    synopsis = serializers.CharField()
+    edition = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    auteurs = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    tags = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
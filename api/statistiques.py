@@ -0,0 +1,189 @@
+from collections import defaultdict
+from functools import cached_property
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Count, Sum
+from django.db.models.signals import post_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Livre, Lecture, StatistiqueMensuelle, StatistiqueTag, StatistiqueAuteur
+
+TAILLE_LOT = 500
+LIMITE = 10
+MOIS_AFFICHES = 24
+ROLLUPS = (StatistiqueMensuelle, StatistiqueTag, StatistiqueAuteur)
+
+def _valeurs_mois(date_debut, date_fin, pages):
+    valeurs = {'livres_lus': 1, 'pages_lues': pages}
+    if date_debut and date_debut <= date_fin:
+        valeurs.update({'pages_chronometrees': pages, 'jours_lecture': (date_fin - date_debut).days + 1})
+    return valeurs
+
+class _Livre:
+    def __init__(self, id, using):
+        self.id = id
+        self.using = using
+
+    @cached_property
+    def nombre_pages(self):
+        return Livre.objects.using(self.using).filter(pk=self.id).values_list('nombre_pages', flat=True).first() or 0
+
+    @cached_property
+    def tags(self):
+        return list(Livre.tags.through.objects.using(self.using).filter(livre_id=self.id).values_list('tag_id', flat=True))
+
+    @cached_property
+    def auteurs(self):
+        return list(Livre.auteurs.through.objects.using(self.using).filter(livre_id=self.id).values_list('auteur_id', flat=True))
+
+def _entrees_mois(etat):
+    lecteur_id, livre_id, statut, note, date_debut, date_fin = etat
+    return (lecteur_id, livre_id, statut, date_debut, date_fin)
+
+def _entrees_notes(etat):
+    lecteur_id, livre_id, statut, note, date_debut, date_fin = etat
+    return (lecteur_id, livre_id, note)
+
+def _contribution(etat, livres, using, mois=True, notes=True):
+    lecteur_id, livre_id, statut, note, date_debut, date_fin = etat
+    contribution = {}
+    if not lecteur_id or not livre_id:
+        return contribution
+    livre = livres.setdefault(livre_id, _Livre(livre_id, using))
+    if mois and statut == 'lu' and date_fin:
+        contribution[(StatistiqueMensuelle, lecteur_id, 'mois', date_fin.replace(day=1))] = _valeurs_mois(date_debut, date_fin, livre.nombre_pages)
+    if notes and note:
+        for modele, champ, ids in ((StatistiqueTag, 'tag_id', livre.tags), (StatistiqueAuteur, 'auteur_id', livre.auteurs)):
+            for id in ids:
+                contribution[(modele, lecteur_id, champ, id)] = {'nombre_notes': 1, 'somme_notes': note}
+    return contribution
+
+def _appliquer(ancienne, nouvelle, using):
+    groupes = defaultdict(list)
+    for cle in ancienne.keys() | nouvelle.keys():
+        avant, apres = ancienne.get(cle, {}), nouvelle.get(cle, {})
+        delta = tuple(sorted(
+            (champ, apres.get(champ, 0) - avant.get(champ, 0)) for champ in avant.keys() | apres.keys()
+            if apres.get(champ, 0) != avant.get(champ, 0)
+        ))
+        if delta:
+            modele, lecteur_id, champ, valeur = cle
+            groupes[(modele, lecteur_id, champ, delta)].append(valeur)
+    for (modele, lecteur_id, champ, delta), valeurs in groupes.items():
+        lignes = modele.objects.using(using)
+        if any(valeur > 0 for _, valeur in delta):
+            lignes.bulk_create([modele(lecteur_id=lecteur_id, **{champ: valeur}) for valeur in valeurs], ignore_conflicts=True)
+        lignes.filter(lecteur_id=lecteur_id, **{f'{champ}__in': valeurs}).update(**{nom: F(nom) + valeur for nom, valeur in delta})
+
+def recalculer_rollups(lecteurs=None, using=DEFAULT_DB_ALIAS):
+    lectures = Lecture.objects.using(using).order_by()
+    if lecteurs is not None:
+        lecteurs = list(lecteurs)
+        lectures = lectures.filter(lecteur_id__in=lecteurs)
+    mensuelles = defaultdict(lambda: defaultdict(int))
+    terminees = lectures.filter(statut='lu', date_fin__isnull=False).values_list('lecteur_id', 'date_debut', 'date_fin', 'livre__nombre_pages')
+    for lecteur_id, date_debut, date_fin, pages in terminees.iterator(chunk_size=2000):
+        ligne = mensuelles[(lecteur_id, date_fin.replace(day=1))]
+        for champ, valeur in _valeurs_mois(date_debut, date_fin, pages).items():
+            ligne[champ] += valeur
+    notes = lectures.filter(note__isnull=False)
+    with transaction.atomic(using=using):
+        for modele in ROLLUPS:
+            existantes = modele.objects.using(using)
+            if lecteurs is not None:
+                existantes = existantes.filter(lecteur_id__in=lecteurs)
+            existantes.delete()
+        StatistiqueMensuelle.objects.using(using).bulk_create(
+            [StatistiqueMensuelle(lecteur_id=lecteur_id, mois=mois, **valeurs) for (lecteur_id, mois), valeurs in mensuelles.items()],
+            batch_size=TAILLE_LOT
+        )
+        for modele, relation in ((StatistiqueTag, 'tag'), (StatistiqueAuteur, 'auteur')):
+            lignes = (
+                notes.filter(**{f'livre__{relation}s__isnull': False})
+                .values('lecteur_id', **{f'{relation}_id': F(f'livre__{relation}s')})
+                .annotate(nombre_notes=Count('id'), somme_notes=Sum('note'))
+            )
+            modele.objects.using(using).bulk_create([modele(**ligne) for ligne in lignes], batch_size=TAILLE_LOT)
+    return len(mensuelles)
+
+def recalculer_rollups_livres(ids, using=DEFAULT_DB_ALIAS):
+    ids = list(ids)
+    lecteurs = set()
+    for debut in range(0, len(ids), TAILLE_LOT):
+        lecteurs.update(
+            Lecture.objects.using(using).filter(livre_id__in=ids[debut:debut + TAILLE_LOT]).values_list('lecteur_id', flat=True).distinct()
+        )
+    if lecteurs:
+        recalculer_rollups(lecteurs, using)
+
+def tableau_de_bord(lecteur=None, adulte=True, using=DEFAULT_DB_ALIAS):
+    def portee(modele):
+        lignes = modele.objects.using(using)
+        return lignes if lecteur is None else lignes.filter(lecteur=lecteur)
+
+    sommes = {'livres': Sum('livres_lus'), 'pages': Sum('pages_lues'), 'pages_chronometrees': Sum('pages_chronometrees'), 'jours': Sum('jours_lecture')}
+    mois = list(portee(StatistiqueMensuelle).values('mois').annotate(**sommes).filter(livres__gt=0).order_by('-mois')[:MOIS_AFFICHES])
+    mois.reverse()
+    totaux = portee(StatistiqueMensuelle).aggregate(**sommes)
+    for ligne in [*mois, totaux]:
+        ligne['vitesse'] = round(ligne['pages_chronometrees'] / ligne['jours'], 1) if ligne['jours'] else None
+    for champ in ('livres', 'pages'):
+        maximum = max((ligne[champ] for ligne in mois), default=0)
+        for ligne in mois:
+            ligne[f'part_{champ}'] = round(100 * ligne[champ] / maximum) if maximum else 0
+
+    def moyennes(modele, relation, nom):
+        lignes = portee(modele)
+        if not adulte and relation == 'tag':
+            lignes = lignes.exclude(tag__pour_adulte=True)
+        lignes = list(
+            lignes.values(f'{relation}_id', nom=F(f'{relation}__{nom}'))
+            .annotate(nombre=Sum('nombre_notes'), somme=Sum('somme_notes'))
+            .filter(nombre__gt=0)
+            .order_by('-nombre', 'nom')[:LIMITE]
+        )
+        for ligne in lignes:
+            ligne['moyenne'] = round(ligne['somme'] / ligne['nombre'], 2)
+        return lignes
+
+    return {
+        'mois': mois,
+        'totaux': totaux,
+        'tags': moyennes(StatistiqueTag, 'tag', 'tag'),
+        'auteurs': moyennes(StatistiqueAuteur, 'auteur', 'nom'),
+    }
+
+@receiver(post_save, sender=Lecture)
+def maj_rollups_lecture(sender, instance, created, using, **kwargs):
+    etat = instance.etat_rollups()
+    if created:
+        _appliquer({}, _contribution(etat, {}, using), using)
+    elif not hasattr(instance, '_etat_rollups'):
+        recalculer_rollups([instance.lecteur_id], using)
+    elif instance._etat_rollups != etat:
+        ancien, livres = instance._etat_rollups, {}
+        parties = {'mois': _entrees_mois(ancien) != _entrees_mois(etat), 'notes': _entrees_notes(ancien) != _entrees_notes(etat)}
+        _appliquer(_contribution(ancien, livres, using, **parties), _contribution(etat, livres, using, **parties), using)
+    instance._etat_rollups = etat
+
+@receiver(pre_delete, sender=Lecture)
+def maj_rollups_lecture_supprimee(sender, instance, using, **kwargs):
+    etat = getattr(instance, '_etat_rollups', instance.etat_rollups())
+    _appliquer(_contribution(etat, {}, using), {}, using)
+
+@receiver(post_save, sender=Livre)
+def maj_rollups_pages_livre(sender, instance, created, using, **kwargs):
+    if not created and getattr(instance, '_nombre_pages_initial', None) != instance.nombre_pages:
+        recalculer_rollups_livres([instance.pk], using)
+    instance._nombre_pages_initial = instance.nombre_pages
+
+@receiver(m2m_changed, sender=Livre.tags.through)
+@receiver(m2m_changed, sender=Livre.auteurs.through)
+def maj_rollups_relations_livre(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            recalculer_rollups_livres([instance.pk], using)
+    elif action == 'pre_clear':
+        instance._livres_rollups = list(instance.livre_set.using(using).values_list('id', flat=True))
+    elif action == 'post_clear':
+        recalculer_rollups_livres(getattr(instance, '_livres_rollups', []), using)
+    elif action.startswith('post_'):
+        recalculer_rollups_livres(pk_set, using)
@@ -1,3 +1,174 @@
+import random
+from unittest import mock
+from datetime import date
+from django.contrib.auth.models import Group, Permission
+from django.db import DatabaseError
+from django.http import QueryDict
 from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+from .ingestion import IngestionCatalogue, CREE, MIS_A_JOUR, ERREUR, IGNORE
+from .models import Auteur, Tag, Livre, Lecture, User, Version
+from .versions import STATISTIQUES
+from .views import AuteurViewSet, TagViewSet, UserViewSet, LivreViewSet, LectureViewSet, LIGNES_PAR_LOT
 
-# Create your tests here.
+LISTES = {
+    'auteurs': (AuteurViewSet, '', 2),
+    'tags': (TagViewSet, '', 2),
+    'users': (UserViewSet, '', 4),
+    'users?expand=liste_de_souhaits': (UserViewSet, 'expand=liste_de_souhaits', 6),
+    'livres': (LivreViewSet, '', 4),
+    'livres?expand=auteurs,tags': (LivreViewSet, 'expand=auteurs,tags', 4),
+    'lectures': (LectureViewSet, '', 1),
+    'lectures?fields=id,statut,note': (LectureViewSet, 'fields=id,statut,note', 1),
+    'lectures?expand=livre.auteurs,lecteur': (LectureViewSet, 'expand=livre.auteurs,lecteur', 6),
+}
+
+DETAILS = {
+    'auteurs': (AuteurViewSet, Auteur, '', 2),
+    'tags': (TagViewSet, Tag, '', 2),
+    'users': (UserViewSet, User, '', 4),
+    'users?expand=liste_de_souhaits': (UserViewSet, User, 'expand=liste_de_souhaits', 6),
+    'livres': (LivreViewSet, Livre, '', 4),
+    'livres?expand=auteurs,tags': (LivreViewSet, Livre, 'expand=auteurs,tags', 4),
+    'lectures': (LectureViewSet, Lecture, '', 1),
+    'lectures?expand=livre.auteurs,lecteur': (LectureViewSet, Lecture, 'expand=livre.auteurs,lecteur', 6),
+}
+
+def ajouter_donnees(nombre_livres, graine):
+    aleatoire = random.Random(graine)
+    auteurs = Auteur.objects.bulk_create([Auteur(nom=f"Auteur {graine}-{i}") for i in range(max(nombre_livres // 5, 1))])
+    tags = Tag.objects.bulk_create([Tag(tag=f"Tag {graine}-{i}", pour_adulte=False) for i in range(5)])
+    livres = Livre.objects.bulk_create([
+        Livre(nom=f"Livre {graine}-{i}", date_sortie=date(2000, 1, 1), nombre_pages=100, synopsis="Synopsis")
+        for i in range(nombre_livres)
+    ])
+    Livre.auteurs.through.objects.bulk_create([
+        Livre.auteurs.through(livre_id=livre.id, auteur_id=aleatoire.choice(auteurs).id) for livre in livres
+    ])
+    Livre.tags.through.objects.bulk_create([
+        Livre.tags.through(livre_id=livre.id, tag_id=tag.id) for livre in livres for tag in aleatoire.sample(tags, 2)
+    ])
+    groupe, _ = Group.objects.get_or_create(name="Lecteurs")
+    lecteurs = User.objects.bulk_create([
+        User(username=f"lecteur_{graine}_{i}", date_naissance=date(1990, 1, 1)) for i in range(max(nombre_livres // 10, 1))
+    ])
+    User.groups.through.objects.bulk_create([User.groups.through(user_id=lecteur.id, group_id=groupe.id) for lecteur in lecteurs])
+    User.liste_de_souhaits.through.objects.bulk_create([
+        User.liste_de_souhaits.through(user_id=lecteur.id, livre_id=livre.id)
+        for lecteur in lecteurs
+        for livre in aleatoire.sample(livres, min(3, len(livres)))
+    ])
+    Lecture.objects.bulk_create([
+        Lecture(livre_id=livre.id, lecteur_id=lecteur.id, statut='lu', note=aleatoire.randint(1, 5))
+        for lecteur in lecteurs
+        for livre in aleatoire.sample(livres, min(5, len(livres)))
+    ])
+
+class NombreRequetesApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        ajouter_donnees(20, graine=1)
+
+    def appeler(self, viewset, action, parametres, **kwargs):
+        vue = viewset.as_view({'get': action})
+        reponse = vue(APIRequestFactory().get('/api/', QueryDict(parametres)), **kwargs)
+        reponse.render()
+        self.assertEqual(reponse.status_code, 200)
+        return reponse
+
+    def verifier_listes(self, volume):
+        for nom, (viewset, parametres, requetes) in LISTES.items():
+            with self.subTest(nom, volume=volume), self.assertNumQueries(requetes):
+                self.appeler(viewset, 'list', parametres)
+
+    def test_listes(self):
+        self.verifier_listes(20)
+        ajouter_donnees(80, graine=2)
+        self.verifier_listes(100)
+
+    def test_details(self):
+        for nom, (viewset, modele, parametres, requetes) in DETAILS.items():
+            identifiant = modele.objects.order_by('id').values_list('id', flat=True).first()
+            with self.subTest(nom), self.assertNumQueries(requetes):
+                self.appeler(viewset, 'retrieve', parametres, pk=identifiant)
+
+class VersionsLectureTests(TestCase):
+    def setUp(self):
+        livre = Livre.objects.create(nom="Livre", date_sortie=date(2000, 1, 1), nombre_pages=100, synopsis="Synopsis")
+        lecteur = User.objects.create(username="lecteur", date_naissance=date(1990, 1, 1))
+        self.lecture = Lecture.objects.get(pk=Lecture.objects.create(livre=livre, lecteur=lecteur, statut='lu', note=3).pk)
+
+    def versions(self):
+        return dict(Version.objects.values_list('cle', 'numero'))
+
+    def test_marque_pages_sans_version_globale(self):
+        avant = self.versions()
+        self.lecture.marque_pages = 12
+        self.lecture.save()
+        apres = self.versions()
+        modifiees = {cle for cle in apres if apres[cle] != avant.get(cle)}
+        self.assertEqual(modifiees, {f'livre:{self.lecture.livre_id}', f'utilisateur:{self.lecture.lecteur_id}'})
+
+    def test_note_sans_version_globale(self):
+        avant = self.versions()
+        self.lecture.note = 4
+        self.lecture.save()
+        apres = self.versions()
+        modifiees = {cle for cle in apres if apres[cle] != avant.get(cle)}
+        self.assertEqual(modifiees, {f'livre:{self.lecture.livre_id}', f'utilisateur:{self.lecture.lecteur_id}', STATISTIQUES})
+
+class IngestionCatalogueTests(TestCase):
+    def ligne(self, **champs):
+        return {'isbn': '9782070368228', 'nom': "L'Étranger", 'date_sortie': date(1942, 5, 19), 'nombre_pages': 184, 'synopsis': "Synopsis", **champs}
+
+    def test_isbn_en_double(self):
+        resultats = IngestionCatalogue().ingerer([self.ligne(nom="Brouillon"), self.ligne()])
+        self.assertEqual([resultat['statut'] for resultat in resultats], [IGNORE, CREE])
+        self.assertEqual(Livre.objects.get().nom, "L'Étranger")
+
+    def test_champ_absent_conserve(self):
+        IngestionCatalogue().ingerer([self.ligne(edition="Folio")])
+        resultats = IngestionCatalogue().ingerer([self.ligne(nombre_pages=200)])
+        self.assertEqual(resultats[0]['statut'], MIS_A_JOUR)
+        livre = Livre.objects.get()
+        self.assertEqual((livre.edition, livre.nombre_pages), ("Folio", 200))
+
+    def test_auteurs_et_tags_sans_casse(self):
+        auteur = Auteur.objects.create(nom="Albert Camus")
+        tag = Tag.objects.create(tag="Roman", pour_adulte=False)
+        IngestionCatalogue().ingerer([self.ligne(auteurs=["albert camus", "ALBERT CAMUS"], tags=["roman"])])
+        livre = Livre.objects.get()
+        self.assertEqual(list(livre.auteurs.all()), [auteur])
+        self.assertEqual(list(livre.tags.all()), [tag])
+        self.assertEqual((Auteur.objects.count(), Tag.objects.count()), (1, 1))
+
+    def test_nom_accentue_existant(self):
+        for isbn in ('1', '2', '3'):
+            IngestionCatalogue().ingerer([self.ligne(isbn=isbn, auteurs=["Émile Zola"], tags=["Éducation"])])
+        self.assertEqual((Auteur.objects.count(), Tag.objects.count()), (1, 1))
+        self.assertEqual(Livre.objects.filter(auteurs__nom="Émile Zola", tags__tag="Éducation").count(), 3)
+
+class ImportLotTests(TestCase):
+    def setUp(self):
+        self.importateur = User.objects.create(username="importateur", date_naissance=date(1990, 1, 1))
+        self.importateur.user_permissions.add(*Permission.objects.filter(codename__in=['creer_livre', 'modifier_livre']))
+
+    def importer(self, lignes):
+        requete = APIRequestFactory().post('/api/livres/lot/', lignes, format='json')
+        force_authenticate(requete, self.importateur)
+        return LivreViewSet.as_view({'post': 'lot'})(requete)
+
+    def ligne(self, isbn):
+        return {'isbn': isbn, 'nom': f"Livre {isbn}", 'date_sortie': '2000-01-01', 'nombre_pages': 100, 'synopsis': "Synopsis"}
+
+    def test_nombre_de_lignes_limite(self):
+        reponse = self.importer([self.ligne(str(i)) for i in range(LIGNES_PAR_LOT + 1)])
+        self.assertEqual(reponse.status_code, 413)
+        self.assertFalse(Livre.objects.exists())
+
+    def test_echec_rapporte_par_ligne(self):
+        with mock.patch('api.ingestion.indexer_livres', side_effect=DatabaseError), self.assertLogs('api.views', 'ERROR'):
+            reponse = self.importer([self.ligne('1'), self.ligne('2')])
+        self.assertEqual(reponse.status_code, 500)
+        self.assertEqual([resultat['statut'] for resultat in reponse.data['resultats']], [ERREUR, ERREUR])
+        self.assertFalse(Livre.objects.exists())
@@ -1,11 +1,28 @@
 from django.utils import timezone
-from datetime import timedelta
+
+AGE_MAJORITE = 18
+
+def calculer_age(date_naissance, aujourdhui=None):
+    aujourdhui = aujourdhui or timezone.localdate()
+    anniversaire_passe = (aujourdhui.month, aujourdhui.day) >= (date_naissance.month, date_naissance.day)
+    return aujourdhui.year - date_naissance.year - (0 if anniversaire_passe else 1)
 
 def est_majeur(user):
-    today = timezone.now().date()
-    age = today - user.date_naissance
-    majorite = timedelta(days=365*18)
-    return age>=majorite
+    return calculer_age(user.date_naissance) >= AGE_MAJORITE
 
 def livre_pour_adulte(livre):
-    len(livre.tags.filter(pour_adulte=True))>0
+    return livre.est_pour_adulte
+
+class PolitiqueContenu:
+    def __init__(self, user):
+        self.voir_pour_adulte = bool(user.is_authenticated and est_majeur(user) and not user.cacher_pour_adulte)
+
+    def peut_voir(self, livre):
+        return self.voir_pour_adulte or not livre_pour_adulte(livre)
+
+def politique_contenu(request):
+    politique = getattr(request, 'politique_contenu', None)
+    if politique is None:
+        politique = PolitiqueContenu(request.user)
+        request.politique_contenu = politique
+    return politique
@@ -0,0 +1,224 @@
+import hashlib
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import Group
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, m2m_changed
+from django.dispatch import receiver, Signal
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.timezone import now
+from django.views.decorators.http import condition
+from .models import Version, Livre, Auteur, Tag, User, Lecture, _contribution_statistiques
+
+TAILLE_LOT = 500
+TOUS = '*'
+STATISTIQUES = 'statistiques'
+AUTOCOMPLETION_LIVRE = 'autocompletion:livre'
+
+versions_incrementees = Signal()
+
+def cle(nom, identifiant=None):
+    return nom if identifiant is None else f'{nom}:{identifiant}'
+
+def incrementer_versions(cles, using=DEFAULT_DB_ALIAS):
+    cles = sorted(set(cles))
+    maintenant = now()
+    versions = Version.objects.using(using)
+    for debut in range(0, len(cles), TAILLE_LOT):
+        lot = cles[debut:debut + TAILLE_LOT]
+        versions.bulk_create([Version(cle=nom, modifie_le=maintenant) for nom in lot], ignore_conflicts=True)
+        versions.filter(cle__in=lot).update(numero=F('numero') + 1, modifie_le=maintenant)
+    versions_incrementees.send(sender=Version, cles=cles, using=using)
+
+def toucher_livres(ids=None, using=DEFAULT_DB_ALIAS, auteurs=(), cles=()):
+    if ids is None:
+        incrementer_versions(['livre', cle('livre', TOUS), cle('auteur', TOUS)], using)
+        return
+    ids = list(ids)
+    auteurs = set(auteurs)
+    for debut in range(0, len(ids), TAILLE_LOT):
+        auteurs.update(
+            Livre.auteurs.through.objects.using(using)
+            .filter(livre_id__in=ids[debut:debut + TAILLE_LOT])
+            .values_list('auteur_id', flat=True)
+        )
+    incrementer_versions(
+        ['livre', *(cle('livre', id) for id in ids), *(cle('auteur', id) for id in auteurs), *cles],
+        using
+    )
+
+def toucher_auteurs(ids, using=DEFAULT_DB_ALIAS):
+    ids = list(ids)
+    livres = Livre.auteurs.through.objects.using(using).filter(auteur_id__in=ids).values_list('livre_id', flat=True)
+    incrementer_versions(
+        ['auteur', 'livre', *(cle('auteur', id) for id in ids), *(cle('livre', id) for id in livres)],
+        using
+    )
+
+def toucher_tags(ids, using=DEFAULT_DB_ALIAS):
+    ids = list(ids)
+    incrementer_versions(['tag', *(cle('tag', id) for id in ids)], using)
+    toucher_livres(
+        Livre.tags.through.objects.using(using).filter(tag_id__in=ids).values_list('livre_id', flat=True).distinct(),
+        using
+    )
+
+def toucher_utilisateurs(ids, using=DEFAULT_DB_ALIAS):
+    incrementer_versions([cle('utilisateur', id) for id in ids], using)
+
+def etat_versions(cles, using=DEFAULT_DB_ALIAS):
+    versions = {
+        nom: (numero, modifie_le)
+        for nom, numero, modifie_le in Version.objects.using(using).filter(cle__in=cles).values_list('cle', 'numero', 'modifie_le')
+    }
+    signature = ';'.join(f'{nom}={versions.get(nom, (0, None))[0]}' for nom in sorted(cles))
+    dates = [modifie_le for _, modifie_le in versions.values()]
+    return signature, max(dates) if dates else None
+
+def _validateurs(cles, variantes):
+    signature, modifie_le = etat_versions(cles)
+    etag = hashlib.sha1('|'.join([signature, *(str(variante) for variante in variantes)]).encode()).hexdigest()
+    return etag, modifie_le
+
+def _controle_cache(reponse, prive):
+    if prive:
+        patch_cache_control(reponse, private=True, no_cache=True)
+    else:
+        patch_cache_control(reponse, no_cache=True)
+    return reponse
+
+def reponse_conditionnelle(request, cles, vue, *args, variantes=(), prive=False, **kwargs):
+    etag, modifie_le = _validateurs(cles, variantes)
+    reponse = condition(
+        etag_func=lambda *a, **k: etag,
+        last_modified_func=lambda *a, **k: modifie_le
+    )(vue)(request, *args, **kwargs)
+    return _controle_cache(reponse, prive)
+
+async def areponse_conditionnelle(request, cles, vue, *args, variantes=(), prive=False, **kwargs):
+    etag, modifie_le = await sync_to_async(_validateurs)(cles, variantes)
+    etag = quote_etag(etag)
+    derniere_modification = int(modifie_le.timestamp()) if modifie_le else None
+    reponse = get_conditional_response(request, etag=etag, last_modified=derniere_modification)
+    if reponse is None:
+        reponse = await vue(request, *args, **kwargs)
+    if derniere_modification and not reponse.has_header('Last-Modified'):
+        reponse.headers['Last-Modified'] = http_date(derniere_modification)
+    reponse.headers.setdefault('ETag', etag)
+    return _controle_cache(reponse, prive)
+
+def conditionnel(cles, variantes=None, prive=False):
+    def decorateur(vue):
+        if iscoroutinefunction(vue):
+            @wraps(vue)
+            async def vue_conditionnelle_async(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await vue(request, *args, **kwargs)
+                cles_vue, variantes_vue = await sync_to_async(
+                    lambda: (cles(request, *args, **kwargs), variantes(request) if variantes else ())
+                )()
+                return await areponse_conditionnelle(
+                    request, cles_vue, vue, *args, variantes=variantes_vue, prive=prive, **kwargs
+                )
+            return vue_conditionnelle_async
+
+        @wraps(vue)
+        def vue_conditionnelle(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return vue(request, *args, **kwargs)
+            return reponse_conditionnelle(
+                request, cles(request, *args, **kwargs), vue, *args,
+                variantes=variantes(request) if variantes else (), prive=prive, **kwargs
+            )
+        return vue_conditionnelle
+    return decorateur
+
+@receiver(post_save, sender=Livre)
+@receiver(pre_delete, sender=Livre)
+def versions_livre(sender, instance, using, signal, **kwargs):
+    libelle_modifie = signal is pre_delete or instance.libelle_modifie
+    toucher_livres([instance.pk], using, cles=[AUTOCOMPLETION_LIVRE] if libelle_modifie else ())
+
+@receiver(post_save, sender=Auteur)
+@receiver(pre_delete, sender=Auteur)
+def versions_auteur(sender, instance, using, **kwargs):
+    toucher_auteurs([instance.pk], using)
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def versions_tag(sender, instance, using, **kwargs):
+    toucher_tags([instance.pk], using)
+
+@receiver(m2m_changed, sender=Livre.auteurs.through)
+def versions_auteurs_livre(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('pre_clear', 'post_add', 'post_remove'):
+        return
+    if not reverse:
+        toucher_livres([instance.pk], using, auteurs=pk_set or ())
+    elif action == 'pre_clear':
+        toucher_livres(instance.livre_set.using(using).values_list('id', flat=True), using, auteurs=[instance.pk])
+    else:
+        toucher_livres(pk_set, using, auteurs=[instance.pk])
+
+@receiver(m2m_changed, sender=Livre.tags.through)
+def versions_tags_livre(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('pre_clear', 'post_add', 'post_remove'):
+        return
+    if not reverse:
+        toucher_livres([instance.pk], using)
+    elif action == 'pre_clear':
+        toucher_livres(instance.livre_set.using(using).values_list('id', flat=True), using)
+    else:
+        toucher_livres(pk_set, using)
+
+@receiver(pre_save, sender=Lecture)
+def memoriser_livre_lecture(sender, instance, **kwargs):
+    contribution = _contribution_statistiques(instance.statut, instance.note)
+    etat = getattr(instance, '_etat_statistiques', None)
+    if etat is None:
+        instance._livre_precedent = None
+        instance._statistiques_modifiees = not instance._state.adding or bool(contribution)
+    else:
+        livre_id, statut, note = etat
+        instance._livre_precedent = livre_id
+        instance._statistiques_modifiees = livre_id != instance.livre_id or _contribution_statistiques(statut, note) != contribution
+
+@receiver(post_save, sender=Lecture)
+def versions_lecture(sender, instance, using, **kwargs):
+    cles = [cle('livre', instance.livre_id), cle('utilisateur', instance.lecteur_id)]
+    if getattr(instance, '_livre_precedent', None) not in (None, instance.livre_id):
+        cles.append(cle('livre', instance._livre_precedent))
+    if getattr(instance, '_statistiques_modifiees', True):
+        cles.append(STATISTIQUES)
+    incrementer_versions(cles, using)
+
+@receiver(pre_delete, sender=Lecture)
+def versions_lecture_supprimee(sender, instance, using, **kwargs):
+    cles = [cle('livre', instance.livre_id), cle('utilisateur', instance.lecteur_id)]
+    if _contribution_statistiques(instance.statut, instance.note):
+        cles.append(STATISTIQUES)
+    incrementer_versions(cles, using)
+
+@receiver(post_save, sender=User)
+def versions_utilisateur(sender, instance, using, **kwargs):
+    toucher_utilisateurs([instance.pk], using)
+
+@receiver(m2m_changed, sender=User.liste_de_souhaits.through)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def versions_relations_utilisateur(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('pre_clear', 'post_add', 'post_remove'):
+        return
+    if not reverse:
+        toucher_utilisateurs([instance.pk], using)
+    elif action == 'pre_clear':
+        toucher_utilisateurs(instance.user_set.using(using).values_list('id', flat=True), using)
+    else:
+        toucher_utilisateurs(pk_set, using)
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def versions_permissions_groupe(sender, action, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        incrementer_versions([cle('utilisateur', TOUS)], using)
@@ -1,23 +1,154 @@
+import logging
+from collections import Counter
+from django.contrib.auth.models import Group, Permission
+from django.db import DatabaseError, transaction
+from django.db.models import Prefetch
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from .models import *
 from .serializers import *
+from .ingestion import IngestionCatalogue, TAILLE_LOT, CREE, MIS_A_JOUR, ERREUR, IGNORE
+from .permissions import PeutImporterLivres
+from .versions import reponse_conditionnelle, cle, TOUS, STATISTIQUES
 
-class AuteurViewSet(ModelViewSet):
+LIGNES_PAR_LOT = TAILLE_LOT
+OCTETS_PAR_LOT = 20 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+def _relation(chemin, etendu, modele):
+    if etendu:
+        return chemin
+    return Prefetch(chemin, queryset=modele.objects.only('id'))
+
+def plan_livre(champs=None, etendre=None, prefixe=''):
+    return [], [
+        _relation(f'{prefixe}{nom}', est_etendu(etendre, nom), modele)
+        for nom, modele in (('auteurs', Auteur), ('tags', Tag))
+        if est_inclus(champs, nom)
+    ]
+
+def plan_user(champs=None, etendre=None, prefixe=''):
+    selections, prefetches = [], [
+        _relation(f'{prefixe}{nom}', False, modele)
+        for nom, modele in (('groups', Group), ('user_permissions', Permission))
+        if est_inclus(champs, nom)
+    ]
+    if est_inclus(champs, 'liste_de_souhaits'):
+        etendu = est_etendu(etendre, 'liste_de_souhaits')
+        prefetches.append(_relation(f'{prefixe}liste_de_souhaits', etendu, Livre))
+        if etendu:
+            prefetches.extend(plan_livre(None, sous_expansions(etendre, 'liste_de_souhaits'), f'{prefixe}liste_de_souhaits__')[1])
+    return selections, prefetches
+
+def plan_lecture(champs=None, etendre=None, prefixe=''):
+    selections, prefetches = [], []
+    for nom, plan in (('livre', plan_livre), ('lecteur', plan_user)):
+        if est_inclus(champs, nom) and est_etendu(etendre, nom):
+            selections.append(f'{prefixe}{nom}')
+            sous_selections, sous_prefetches = plan(None, sous_expansions(etendre, nom), f'{prefixe}{nom}__')
+            selections.extend(sous_selections)
+            prefetches.extend(sous_prefetches)
+    return selections, prefetches
+
+class PlanRequetesMixin:
+    plan_requetes = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.plan_requetes is None:
+            return queryset
+        selections, prefetches = self.plan_requetes(
+            lire_liste(self.request, 'fields'), lire_liste(self.request, 'expand')
+        )
+        if selections:
+            queryset = queryset.select_related(*selections)
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset
+
+class ConditionnelMixin:
+    nom_version = None
+    cles_liste = ()
+
+    def list(self, request, *args, **kwargs):
+        return reponse_conditionnelle(
+            request, [self.nom_version, *self.cles_liste], super().list, *args,
+            variantes=(request.accepted_renderer.format,), **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        identifiant = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return reponse_conditionnelle(
+            request, [cle(self.nom_version, identifiant), cle(self.nom_version, TOUS)], super().retrieve, *args,
+            variantes=(request.accepted_renderer.format,), **kwargs
+        )
+
+class AuteurViewSet(ConditionnelMixin, ModelViewSet):
     queryset = Auteur.objects.all()
     serializer_class = AuteurSerializer
+    nom_version = 'auteur'
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(ConditionnelMixin, ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    nom_version = 'tag'
 
-class UserViewSet(ModelViewSet):
+class UserViewSet(PlanRequetesMixin, ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    plan_requetes = staticmethod(plan_user)
 
-class LivreViewSet(ModelViewSet):
+class LivreViewSet(ConditionnelMixin, PlanRequetesMixin, ModelViewSet):
     queryset = Livre.objects.all()
     serializer_class = LivreSerializer
+    plan_requetes = staticmethod(plan_livre)
+    nom_version = 'livre'
+    cles_liste = (cle('livre', TOUS), 'auteur', 'tag', STATISTIQUES)
+
+    @action(detail=False, methods=['post'], permission_classes=[PeutImporterLivres])
+    def lot(self, request):
+        longueur = request.META.get('CONTENT_LENGTH', '')
+        if longueur.isdigit() and int(longueur) > OCTETS_PAR_LOT:
+            return Response({'detail': f"Corps limité à {OCTETS_PAR_LOT} octets."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if not isinstance(request.data, list):
+            return Response({'detail': "Une liste de livres est attendue."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > LIGNES_PAR_LOT:
+            return Response({'detail': f"Au plus {LIGNES_PAR_LOT} livres par requête."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        resultats, valides = [None] * len(request.data), []
+        validateur = LigneCatalogueSerializer()
+        for index, donnees in enumerate(request.data):
+            try:
+                valides.append((index, validateur.run_validation(donnees)))
+            except ValidationError as erreur:
+                isbn = donnees.get('isbn') if isinstance(donnees, dict) else None
+                resultats[index] = {'index': index, 'isbn': isbn, 'statut': ERREUR, 'erreurs': erreur.detail}
+        code = status.HTTP_200_OK if valides or not resultats else status.HTTP_400_BAD_REQUEST
+        try:
+            with transaction.atomic():
+                ingestion = IngestionCatalogue(taille_lot=LIGNES_PAR_LOT).ingerer([ligne for _, ligne in valides])
+        except DatabaseError:
+            logger.exception("Échec de l'import en lot")
+            code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            ingestion = [
+                {'isbn': ligne['isbn'], 'id': None, 'statut': ERREUR, 'erreurs': ["Lot annulé : aucune ligne n'a été enregistrée."]}
+                for _, ligne in valides
+            ]
+        for (index, _), resultat in zip(valides, ingestion):
+            resultats[index] = {'index': index, **resultat}
+        comptes = Counter(resultat['statut'] for resultat in resultats)
+        return Response({
+            CREE: comptes[CREE],
+            MIS_A_JOUR: comptes[MIS_A_JOUR],
+            ERREUR: comptes[ERREUR],
+            IGNORE: comptes[IGNORE],
+            'resultats': resultats,
+        }, status=code)
 
-class LectureViewSet(ModelViewSet):
+class LectureViewSet(PlanRequetesMixin, ModelViewSet):
     queryset = Lecture.objects.all()
     serializer_class = LectureSerializer
+    plan_requetes = staticmethod(plan_lecture)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LivresConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "livres"
+
+    def ready(self):
+        from . import fragments
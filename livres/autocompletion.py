@@ -0,0 +1,69 @@
+import threading
+import unicodedata
+from bisect import bisect_left
+from django.db import DEFAULT_DB_ALIAS
+from api.models import Livre, Auteur, Tag, Version
+from api.versions import AUTOCOMPLETION_LIVRE
+
+LIMITE = 10
+LIMITE_MAX = 50
+TAILLE_LOT = 5000
+
+def normaliser(texte):
+    decompose = unicodedata.normalize('NFKD', (texte or '').casefold())
+    return ' '.join(''.join(caractere for caractere in decompose if not unicodedata.combining(caractere)).split())
+
+class IndexPrefixes:
+    def __init__(self, modele, champ, champ_adulte=None, cle_version=None):
+        self.modele = modele
+        self.cle_version = cle_version or modele._meta.model_name
+        self.champ = champ
+        self.champ_adulte = champ_adulte
+        self.version = None
+        self.donnees = ([], [])
+        self.verrou = threading.Lock()
+
+    def _construire(self, using):
+        champs = ['id', self.champ, *([self.champ_adulte] if self.champ_adulte else [])]
+        entrees = []
+        for identifiant, libelle, *adulte in self.modele.objects.using(using).values_list(*champs).iterator(chunk_size=TAILLE_LOT):
+            mots = normaliser(libelle).split()
+            pour_adulte = bool(adulte and adulte[0])
+            for position in range(len(mots)):
+                entrees.append((' '.join(mots[position:]), identifiant, libelle, pour_adulte))
+        entrees.sort()
+        return [entree[0] for entree in entrees], [entree[1:] for entree in entrees]
+
+    def a_jour(self, using=DEFAULT_DB_ALIAS):
+        version = Version.objects.using(using).filter(cle=self.cle_version).values_list('numero', flat=True).first() or 0
+        if version != self.version:
+            with self.verrou:
+                if version != self.version:
+                    self.donnees = self._construire(using)
+                    self.version = version
+        return self
+
+    def chercher(self, texte, limite=LIMITE, adulte=True):
+        prefixe = normaliser(texte)
+        if not prefixe:
+            return []
+        cles, valeurs = self.donnees
+        resultats, vus = [], set()
+        for index in range(bisect_left(cles, prefixe), len(cles)):
+            if not cles[index].startswith(prefixe) or len(resultats) >= limite:
+                break
+            identifiant, libelle, pour_adulte = valeurs[index]
+            if identifiant in vus or (pour_adulte and not adulte):
+                continue
+            vus.add(identifiant)
+            resultats.append({'id': identifiant, 'libelle': libelle})
+        return resultats
+
+INDEX = {
+    'livre': IndexPrefixes(Livre, 'nom', 'est_pour_adulte', AUTOCOMPLETION_LIVRE),
+    'auteur': IndexPrefixes(Auteur, 'nom'),
+    'tag': IndexPrefixes(Tag, 'tag'),
+}
+
+def suggestions(type, texte, limite=LIMITE, adulte=True, using=DEFAULT_DB_ALIAS):
+    return INDEX[type].a_jour(using).chercher(texte, limite, adulte)
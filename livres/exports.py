@@ -0,0 +1,135 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from itertools import islice
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from api.models import Livre
+
+TAILLE_LOT = 2000
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+COLONNES_CATALOGUE = (
+    ('id', 'int64'),
+    ('isbn', 'string'),
+    ('nom', 'string'),
+    ('auteurs', 'string'),
+    ('tags', 'string'),
+    ('date_sortie', 'date32'),
+    ('nombre_pages', 'int64'),
+    ('edition', 'string'),
+    ('moyenne_notes', 'float64'),
+    ('nombre_notes', 'int64'),
+    ('nombre_lectures', 'int64'),
+    ('synopsis', 'string'),
+)
+COLONNES_LECTURES = (
+    ('livre_id', 'int64'),
+    ('livre_nom', 'string'),
+    ('isbn', 'string'),
+    ('statut', 'string'),
+    ('note', 'int64'),
+    ('date_debut', 'date32'),
+    ('date_fin', 'date32'),
+    ('marque_pages', 'int64'),
+    ('commentaire', 'string'),
+)
+
+def _lots(lignes):
+    iterateur = iter(lignes)
+    while lot := list(islice(iterateur, TAILLE_LOT)):
+        yield lot
+
+def _noms_lies(relation, champ, ids):
+    noms = defaultdict(list)
+    for livre_id, nom in relation.through.objects.filter(livre_id__in=ids).values_list('livre_id', champ):
+        noms[livre_id].append(nom)
+    return noms
+
+def lignes_catalogue(livres):
+    champs = [nom for nom, _ in COLONNES_CATALOGUE if nom not in ('auteurs', 'tags')]
+    for lot in _lots(livres.values(*champs).iterator(chunk_size=TAILLE_LOT)):
+        ids = [livre['id'] for livre in lot]
+        auteurs = _noms_lies(Livre.auteurs, 'auteur__nom', ids)
+        tags = _noms_lies(Livre.tags, 'tag__tag', ids)
+        for livre in lot:
+            livre['auteurs'] = ', '.join(auteurs[livre['id']])
+            livre['tags'] = ', '.join(tags[livre['id']])
+            yield livre
+
+def lignes_lectures(lectures):
+    return lectures.values(
+        'livre_id', 'statut', 'note', 'date_debut', 'date_fin', 'marque_pages', 'commentaire',
+        livre_nom=F('livre__nom'), isbn=F('livre__isbn')
+    ).iterator(chunk_size=TAILLE_LOT)
+
+class _Echo:
+    def write(self, valeur):
+        return valeur
+
+class _Tampon(io.RawIOBase):
+    def __init__(self):
+        self.morceaux = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, donnees):
+        donnees = bytes(donnees)
+        self.morceaux.append(donnees)
+        self.position += len(donnees)
+        return len(donnees)
+
+    def tell(self):
+        return self.position
+
+    def vider(self):
+        donnees = b''.join(self.morceaux)
+        self.morceaux = []
+        return donnees
+
+def _csv(colonnes, lignes):
+    noms = [nom for nom, _ in colonnes]
+    writer = csv.writer(_Echo())
+    yield writer.writerow(noms)
+    for lot in _lots(lignes):
+        yield ''.join(writer.writerow([ligne[nom] for nom in noms]) for ligne in lot)
+
+def _jsonl(colonnes, lignes):
+    noms = [nom for nom, _ in colonnes]
+    for lot in _lots(lignes):
+        yield ''.join(
+            json.dumps({nom: ligne[nom] for nom in noms}, ensure_ascii=False, default=str) + '\n'
+            for ligne in lot
+        )
+
+def _parquet(colonnes, lignes):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(nom, getattr(pa, type_arrow)()) for nom, type_arrow in colonnes])
+    tampon = _Tampon()
+    writer = pq.ParquetWriter(pa.PythonFile(tampon, mode='w'), schema)
+    try:
+        for lot in _lots(lignes):
+            writer.write_table(pa.Table.from_pylist(lot, schema=schema))
+            yield tampon.vider()
+    finally:
+        writer.close()
+    yield tampon.vider()
+
+GENERATEURS = {
+    'csv': _csv,
+    'jsonl': _jsonl,
+    'parquet': _parquet,
+}
+
+def reponse_export(nom_fichier, format, colonnes, lignes):
+    reponse = StreamingHttpResponse(GENERATEURS[format](colonnes, lignes), content_type=FORMATS[format])
+    reponse['Content-Disposition'] = f'attachment; filename="{nom_fichier}.{format}"'
+    return reponse
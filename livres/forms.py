@@ -1,6 +1,8 @@
 from django import forms
+from django.core.exceptions import ValidationError
 from django.contrib.auth.forms import UserCreationForm, PasswordChangeForm
 from api.models import Livre, Auteur, Tag, Lecture, User
+from .widgets import SaisieAutocompletee, SelectionDistante, SelectionMultipleDistante
 
 class UserForm(UserCreationForm):
     date_naissance = forms.DateField(
@@ -78,16 +80,35 @@ class CustomPasswordChangeForm(PasswordChangeForm):
         self.fields['new_password1'].widget.attrs.update({'class': 'form-control'})
         self.fields['new_password2'].widget.attrs.update({'class': 'form-control'})
 
+class ChoixMultipleDistant(forms.ModelMultipleChoiceField):
+    def _check_values(self, value):
+        identifiants = []
+        for pk in value:
+            try:
+                identifiants.append(int(pk))
+            except (TypeError, ValueError):
+                raise ValidationError(self.error_messages['invalid_pk_value'], code='invalid_pk_value', params={'pk': pk})
+        identifiants = list(dict.fromkeys(identifiants))
+        objets = self.queryset.in_bulk(identifiants)
+        for identifiant in identifiants:
+            if identifiant not in objets:
+                raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': identifiant})
+        return [objets[identifiant] for identifiant in identifiants]
+
 class LivreForm(forms.ModelForm):
-    auteurs = forms.ModelMultipleChoiceField(
+    auteurs = ChoixMultipleDistant(
         queryset=Auteur.objects.all(),
-        widget=forms.CheckboxSelectMultiple(),
+        widget=SelectionMultipleDistante('auteur', attrs={
+            'class': 'form-select'
+        }),
         required=True
     )
 
-    tags = forms.ModelMultipleChoiceField(
+    tags = ChoixMultipleDistant(
         queryset=Tag.objects.all(),
-        widget=forms.CheckboxSelectMultiple(),
+        widget=SelectionMultipleDistante('tag', attrs={
+            'class': 'form-select'
+        }),
         required=True
     )
 
@@ -186,11 +207,17 @@ class SearchForm(forms.Form):
         })
     )
 
+    def __init__(self, *args, autocompletion=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if autocompletion:
+            widget = self.fields['recherche'].widget
+            self.fields['recherche'].widget = SaisieAutocompletee(autocompletion, attrs=widget.attrs)
+
 class SearchLivreForm(forms.Form):
     recherche = forms.CharField(
         max_length=100,
         required=False,
-        widget=forms.TextInput(attrs={
+        widget=SaisieAutocompletee('livre', attrs={
             'class':'form-control',
             'placeholder':'Rechercher',
             'aria-label': 'Rechercher',
@@ -200,15 +227,35 @@ class SearchLivreForm(forms.Form):
     tags = forms.ModelMultipleChoiceField(
         queryset=Tag.objects.all().order_by("tag"),
         required=False,
-        widget=forms.CheckboxSelectMultiple(
-            attrs={
-                'class': 'form-check-input'
-            }
-        )
+        widget=SelectionMultipleDistante('tag', attrs={
+            'class': 'form-select',
+        })
+    )
+    mode_tags = forms.ChoiceField(
+        choices=[
+            ('et', 'Tous les tags sélectionnés'),
+            ('ou', 'Au moins un des tags sélectionnés')
+        ],
+        initial='et',
+        required=False,
+        widget=forms.Select(attrs={
+            'class': 'form-select',
+        })
     )
     auteur = forms.ModelChoiceField(
         queryset=Auteur.objects.all().order_by("nom"),
         required=False,
+        widget=SelectionDistante('auteur', attrs={
+            'class': 'form-select',
+        })
+    )
+    tri = forms.ChoiceField(
+        choices=[
+            ('', 'Par titre'),
+            ('mieux_notes', 'Les mieux notés'),
+            ('plus_lus', 'Les plus lus')
+        ],
+        required=False,
         widget=forms.Select(attrs={
             'class': 'form-select',
         })
@@ -300,6 +347,12 @@ class LectureForm(forms.ModelForm):
         if self.instance and self.instance.pk and self.instance.date_fin:
             self.initial['date_fin'] = self.instance.date_fin.strftime('%Y-%m-%d')
 
+class LecturePartielleForm(LectureForm):
+    def __init__(self, data, *args, **kwargs):
+        super().__init__(data, *args, **kwargs)
+        for champ in set(self.fields) - set(data):
+            del self.fields[champ]
+
 class MarquePagesForm(forms.ModelForm):
     class Meta:
         model = Lecture
@@ -0,0 +1,86 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.dispatch import receiver
+from api.models import Version
+from api.utils import politique_contenu
+from api.versions import versions_incrementees, TOUS
+
+DUREE_FRAGMENTS = getattr(settings, 'DUREE_FRAGMENTS', 60 * 60 * 24)
+ADULTE = 'adulte'
+TOUT_PUBLIC = 'tout_public'
+AUDIENCES = (ADULTE, TOUT_PUBLIC)
+GENERATION = 'fragments:generation'
+GENERATION_TAGS = 'fragments:generation_tags'
+
+def audience(request):
+    return ADULTE if politique_contenu(request).voir_pour_adulte else TOUT_PUBLIC
+
+def _generations():
+    generations = cache.get_many([GENERATION, GENERATION_TAGS])
+    return generations.get(GENERATION, 0), generations.get(GENERATION_TAGS, 0)
+
+def _contexte(request, generations):
+    return {
+        'duree': DUREE_FRAGMENTS,
+        'generation': generations.get(GENERATION, 0),
+        'generation_tags': generations.get(GENERATION_TAGS, 0),
+        'audience': audience(request),
+    }
+
+def contexte_fragments(request):
+    return _contexte(request, cache.get_many([GENERATION, GENERATION_TAGS]))
+
+async def acontexte_fragments(request):
+    return _contexte(request, await cache.aget_many([GENERATION, GENERATION_TAGS]))
+
+def _cartes(livres, fragments):
+    return {make_template_fragment_key('carte_livre', [fragments['generation'], livre.id]): livre for livre in livres}
+
+def prefetcher_cartes(livres, fragments):
+    cartes = _cartes(livres, fragments)
+    en_cache = cache.get_many(list(cartes))
+    prefetch_related_objects([livre for cle, livre in cartes.items() if cle not in en_cache], 'auteurs')
+
+async def aprefetcher_cartes(livres, fragments):
+    cartes = _cartes(livres, fragments)
+    en_cache = await cache.aget_many(list(cartes))
+    await sync_to_async(prefetch_related_objects)([livre for cle, livre in cartes.items() if cle not in en_cache], 'auteurs')
+
+def _incrementer(cle):
+    try:
+        cache.incr(cle)
+    except ValueError:
+        cache.set(cle, 1, None)
+
+def cles_fragments(cles):
+    generation = _generations()[0]
+    fragments, generations = [], set()
+    for cle in cles:
+        nom, _, identifiant = cle.partition(':')
+        if identifiant == TOUS and nom in ('livre', 'auteur'):
+            generations.add(GENERATION)
+        elif nom == 'tag' and not identifiant:
+            generations.add(GENERATION_TAGS)
+        elif nom == 'livre' and identifiant:
+            fragments.append(make_template_fragment_key('carte_livre', [generation, identifiant]))
+        elif nom == 'auteur' and identifiant:
+            fragments.extend(
+                make_template_fragment_key('detail_auteur', [generation, identifiant, public])
+                for public in AUDIENCES
+            )
+    return fragments, generations
+
+def invalider_fragments(cles):
+    fragments, generations = cles_fragments(cles)
+    for generation in generations:
+        _incrementer(generation)
+    if fragments:
+        cache.delete_many(fragments)
+
+@receiver(versions_incrementees, sender=Version)
+def invalider_fragments_versions(sender, cles, using, **kwargs):
+    transaction.on_commit(lambda: invalider_fragments(cles), using=using)
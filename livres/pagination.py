@@ -0,0 +1,105 @@
+import base64
+import binascii
+import json
+import math
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+TAILLE_PAGE = 24
+PARAMETRES_PAGINATION = ('page', 'apres', 'avant')
+
+def _encoder_curseur(objet, champ):
+    valeurs = [getattr(objet, champ.lstrip('-')), objet.id]
+    return base64.urlsafe_b64encode(json.dumps(valeurs).encode()).decode()
+
+def _decoder_curseur(curseur):
+    if not curseur:
+        return None
+    try:
+        valeur, identifiant = json.loads(base64.urlsafe_b64decode(curseur.encode()))
+        return valeur, int(identifiant)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+def _valider_curseur(queryset, champ, curseur):
+    if curseur is None:
+        return None
+    valeur, identifiant = curseur
+    try:
+        valeur = queryset.model._meta.get_field(champ).to_python(valeur)
+    except (ValidationError, TypeError):
+        return None
+    if isinstance(valeur, float) and not math.isfinite(valeur):
+        return None
+    return valeur, identifiant
+
+def _lien(request, **parametres):
+    requete = request.GET.copy()
+    for parametre in PARAMETRES_PAGINATION:
+        requete.pop(parametre, None)
+    for cle, valeur in parametres.items():
+        requete[cle] = valeur
+    return f"?{requete.urlencode()}"
+
+def _suivants(queryset, champ, valeur, identifiant, decroissant):
+    comparaison = 'lt' if decroissant else 'gt'
+    if valeur is None:
+        nuls = Q(**{f'{champ}__isnull': True, f'id__{comparaison}': identifiant})
+        return nuls if decroissant else nuls | Q(**{f'{champ}__isnull': False})
+    condition = Q(**{f'{champ}__{comparaison}e': valeur}) & (
+        Q(**{f'{champ}__{comparaison}': valeur}) | Q(**{f'id__{comparaison}': identifiant})
+    )
+    if decroissant and queryset.model._meta.get_field(champ).null:
+        condition |= Q(**{f'{champ}__isnull': True})
+    return condition
+
+def _requete_curseur(request, queryset, champ, taille):
+    decroissant = champ.startswith('-')
+    nom = champ.lstrip('-')
+    ordre = (f'-{nom}', '-id') if decroissant else (nom, 'id')
+    inverse = (nom, 'id') if decroissant else (f'-{nom}', '-id')
+    queryset = queryset.order_by(*ordre)
+    apres = _valider_curseur(queryset, nom, _decoder_curseur(request.GET.get('apres')))
+    avant = _valider_curseur(queryset, nom, _decoder_curseur(request.GET.get('avant')))
+    if avant:
+        queryset = queryset.filter(_suivants(queryset, nom, *avant, not decroissant)).order_by(*inverse)
+    elif apres:
+        queryset = queryset.filter(_suivants(queryset, nom, *apres, decroissant))
+    return queryset[:taille + 1], apres, avant
+
+def _page_curseur(request, objets, champ, taille, apres, avant):
+    if avant:
+        a_precedent = len(objets) > taille
+        objets = objets[:taille][::-1]
+        a_suivant = True
+    else:
+        a_suivant = len(objets) > taille
+        objets = objets[:taille]
+        a_precedent = apres is not None
+    pagination = {
+        'precedent': _lien(request, avant=_encoder_curseur(objets[0], champ)) if a_precedent and objets else None,
+        'suivant': _lien(request, apres=_encoder_curseur(objets[-1], champ)) if a_suivant and objets else None,
+    }
+    return objets, pagination
+
+def paginer_par_curseur(request, queryset, champ='nom', taille=TAILLE_PAGE):
+    queryset, apres, avant = _requete_curseur(request, queryset, champ, taille)
+    return _page_curseur(request, list(queryset), champ, taille, apres, avant)
+
+async def apaginer_par_curseur(request, queryset, champ='nom', taille=TAILLE_PAGE):
+    queryset, apres, avant = _requete_curseur(request, queryset, champ, taille)
+    return _page_curseur(request, [objet async for objet in queryset], champ, taille, apres, avant)
+
+def paginer_par_numero(request, queryset, taille=TAILLE_PAGE):
+    page = Paginator(queryset, taille).get_page(request.GET.get('page'))
+    pagination = {
+        'precedent': _lien(request, page=page.previous_page_number()) if page.has_previous() else None,
+        'suivant': _lien(request, page=page.next_page_number()) if page.has_next() else None,
+        'numero': page.number,
+        'nombre_pages': page.paginator.num_pages,
+    }
+    return list(page), pagination
+
+apaginer_par_numero = sync_to_async(paginer_par_numero)
@@ -0,0 +1,52 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+TAILLES_AFFICHAGE = {
+    'liste': "(min-width: 1200px) 25vw, (min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw",
+    'detail': "(min-width: 768px) 33vw, 100vw",
+}
+TYPES_MIME = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+}
+
+@register.simple_tag
+def image_livre(livre, taille='liste', classe='', alt=''):
+    alt = alt or livre.nom
+    variantes = (livre.renditions or {}).get('variantes', [])
+    if not variantes:
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy">', livre.image.url, classe, alt)
+
+    formats = []
+    for variante in variantes:
+        if variante['format'] not in formats:
+            formats.append(variante['format'])
+
+    def srcset(format_image):
+        return ', '.join(
+            f"{default_storage.url(variante['nom'])} {variante['largeur']}w"
+            for variante in variantes if variante['format'] == format_image
+        )
+
+    repli = next(
+        (variante for variante in variantes if variante['taille'] == taille and variante['format'] == formats[-1]),
+        variantes[0]
+    )
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((TYPES_MIME[format_image], srcset(format_image), TAILLES_AFFICHAGE.get(taille, '100vw')) for format_image in formats[:-1])
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy"></picture>',
+        sources,
+        default_storage.url(repli['nom']),
+        srcset(formats[-1]),
+        TAILLES_AFFICHAGE.get(taille, '100vw'),
+        classe,
+        alt
+    )
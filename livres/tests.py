@@ -1,3 +1,149 @@
+import base64
+import json
+from datetime import date, datetime, timezone
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from api.models import Auteur, Lecture, Livre, Tag, User, Version
+from api.versions import AUTOCOMPLETION_LIVRE, toucher_livres
+from .autocompletion import suggestions
 
-# Create your tests here.
+def creer_livres(nombre, premier=0):
+    auteur = Auteur.objects.create(nom=f"Auteur {premier}")
+    livres = []
+    for i in range(premier, premier + nombre):
+        livre = Livre.objects.create(nom=f"Livre {i}", date_sortie=date(2000, 1, 1), nombre_pages=100, synopsis="Synopsis")
+        livre.auteurs.add(auteur)
+        livres.append(livre)
+    return livres
+
+class BibliothequeTests(TestCase):
+    def setUp(self):
+        self.lecteur = User.objects.create_user('lecteur', password='secret', date_naissance=date(1990, 1, 1))
+        self.client.force_login(self.lecteur)
+
+    def ajouter_lectures(self, nombre, premier=0):
+        statuts = [statut for statut, _ in Lecture.STATUT_CHOICES]
+        for i, livre in enumerate(creer_livres(nombre, premier)):
+            Lecture.objects.create(livre=livre, lecteur=self.lecteur, statut=statuts[i % len(statuts)])
+
+    def test_nombre_de_requetes_constant(self):
+        self.ajouter_lectures(5)
+        with self.assertNumQueries(6):
+            reponse = self.client.get(reverse('livres:bibliotheque'))
+        self.assertEqual(len(reponse.context['lectures']), 5)
+        self.ajouter_lectures(20, premier=5)
+        with self.assertNumQueries(6):
+            reponse = self.client.get(reverse('livres:bibliotheque'))
+        self.assertEqual(len(reponse.context['lectures']), 25)
+
+class DetailLivreTests(TestCase):
+    def setUp(self):
+        self.livre, self.autre_livre = creer_livres(2)
+        self.livre.tags.add(Tag.objects.create(tag="Roman", pour_adulte=False))
+        self.lecteur = User.objects.create_user('lecteur', password='secret', date_naissance=date(1990, 1, 1))
+        Lecture.objects.create(livre=self.livre, lecteur=self.lecteur, statut='en cours', marque_pages=10)
+
+    def test_anonyme(self):
+        with self.assertNumQueries(5):
+            reponse = self.client.get(reverse('livres:detail_livre', args=[self.livre.id]))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIsNone(reponse.context['lecture'])
+
+    def test_connecte_avec_lecture(self):
+        self.client.force_login(self.lecteur)
+        with self.assertNumQueries(10):
+            reponse = self.client.get(reverse('livres:detail_livre', args=[self.livre.id]))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.context['pages_restantes'], 90)
+
+    def test_connecte_sans_lecture(self):
+        self.client.force_login(self.lecteur)
+        with self.assertNumQueries(10):
+            reponse = self.client.get(reverse('livres:detail_livre', args=[self.autre_livre.id]))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.context['bouton_ajouter'])
+
+    def test_livre_pour_adulte_interdit_aux_anonymes(self):
+        self.autre_livre.tags.add(Tag.objects.create(tag="Adulte", pour_adulte=True))
+        reponse = self.client.get(reverse('livres:detail_livre', args=[self.autre_livre.id]))
+        self.assertEqual(reponse.status_code, 403)
+
+class ListeLivresTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        creer_livres(5)
+
+    def test_cartes_en_cache_sans_auteurs(self):
+        with self.assertNumQueries(3):
+            reponse = self.client.get(reverse('livres:rechercher'))
+        self.assertContains(reponse, "Auteur 0", count=5)
+        with self.assertNumQueries(2):
+            reponse = self.client.get(reverse('livres:rechercher'))
+        self.assertContains(reponse, "Auteur 0", count=5)
+
+    def test_curseur_altere(self):
+        for tri in ('mieux_notes', 'plus_lus'):
+            for valeurs in (["abc", 1], [{"a": 1}, 1], [float('nan'), 1], [None, "x"]):
+                curseur = base64.urlsafe_b64encode(json.dumps(valeurs).encode()).decode()
+                for sens in ('apres', 'avant'):
+                    with self.subTest(tri=tri, valeurs=valeurs, sens=sens):
+                        reponse = self.client.get(reverse('livres:rechercher'), {'tri': tri, sens: curseur})
+                        self.assertEqual(reponse.status_code, 200)
+                        self.assertEqual(len(reponse.context['livres']), 5)
+
+class MarquePagesTests(TestCase):
+    def setUp(self):
+        self.livre, autre_livre = creer_livres(2)
+        self.lecteur = User.objects.create_user('lecteur', password='secret', date_naissance=date(1990, 1, 1))
+        self.lecture = Lecture.objects.create(livre=self.livre, lecteur=self.lecteur, statut='en cours', marque_pages=10)
+        self.autre_lecture = Lecture.objects.create(livre=autre_livre, lecteur=self.lecteur, statut='en cours')
+        self.client.force_login(self.lecteur)
+
+    def synchroniser(self, *entrees):
+        corps = json.dumps({'marque_pages': [{'lecture': lecture.id, 'page': page, 'horodatage': horodatage} for lecture, page, horodatage in entrees]})
+        return self.client.post(reverse('livres:synchroniser_marque_pages'), corps, content_type='application/json').json()
+
+    def test_horodatage_inchange_sans_modification(self):
+        lecture = Lecture.objects.get(pk=self.lecture.pk)
+        horodatage = lecture.marque_pages_horodatage
+        lecture.commentaire = "Commentaire"
+        lecture.save()
+        lecture.refresh_from_db()
+        self.assertEqual(lecture.marque_pages_horodatage, horodatage)
+
+    def test_synchronisation_horodatage_client(self):
+        horodatage = 1_700_000_000_000
+        reponse = self.synchroniser((self.autre_lecture, 20, horodatage))
+        self.assertEqual(reponse, {'recus': 1, 'appliques': 1, 'rejetes': []})
+        self.autre_lecture.refresh_from_db()
+        self.assertEqual(self.autre_lecture.marque_pages, 20)
+        self.assertEqual(self.autre_lecture.marque_pages_horodatage, datetime.fromtimestamp(horodatage / 1000, timezone.utc))
+
+    def test_synchronisation_page_hors_livre(self):
+        reponse = self.synchroniser((self.lecture, 500, 1_700_000_000_000), (self.autre_lecture, 20, 1_700_000_000_000))
+        self.assertEqual(reponse, {'recus': 2, 'appliques': 1, 'rejetes': [{'lecture': self.lecture.id, 'page': 500}]})
+        self.lecture.refresh_from_db()
+        self.assertEqual(self.lecture.marque_pages, 10)
+
+class AutocompletionTests(TestCase):
+    def setUp(self):
+        self.livre = Livre.objects.get(pk=creer_livres(1)[0].pk)
+
+    def version(self):
+        return Version.objects.filter(cle=AUTOCOMPLETION_LIVRE).values_list('numero', flat=True).first()
+
+    def test_index_conserve_sans_changement_de_titre(self):
+        version = self.version()
+        self.livre.synopsis = "Autre synopsis"
+        self.livre.save()
+        toucher_livres([self.livre.pk])
+        self.assertEqual(self.version(), version)
+
+    def test_index_reconstruit_apres_changement_de_titre(self):
+        self.assertEqual(suggestions('livre', "livre"), [{'id': self.livre.id, 'libelle': "Livre 0"}])
+        self.livre.nom = "Germinal"
+        self.livre.save()
+        self.assertEqual(suggestions('livre', "germ"), [{'id': self.livre.id, 'libelle': "Germinal"}])
+        self.livre.tags.add(Tag.objects.create(tag="Adulte", pour_adulte=True))
+        self.assertEqual(suggestions('livre', "germ", adulte=False), [])
@@ -1,9 +1,16 @@
+from django.conf import settings
 from django.urls import path
 from .views import *
 from django.contrib.auth import views as auth_views
 
 app_name = 'livres'
 
+if settings.VUES_ASYNCHRONES:
+    lister_livres = lister_livres_async
+    detail_livre = detail_livre_async
+    detail_auteur = detail_auteur_async
+    liste_de_souhaits = liste_de_souhaits_async
+
 urlpatterns = [
     path('', lister_livres, name='rechercher'),
     path('livre/creer/', creer_livre, name='creer_livre'),
@@ -20,9 +27,15 @@ urlpatterns = [
     path('tag/<int:id>/modifier/', modifier_tag, name='modifier_tag'),
     path('tag/<int:id>/supprimer/', supprimer_tag, name='supprimer_tag'),
     path('bibliotheque/', bibliotheque, name='bibliotheque'),
+    path('statistiques/', statistiques, name='statistiques'),
+    path('autocompletion/', autocompletion, name='autocompletion'),
+    path('export/catalogue.<str:format>', exporter_catalogue, name='exporter_catalogue'),
+    path('export/lectures.<str:format>', exporter_lectures, name='exporter_lectures'),
     path('livre/<int:id>/ajouter/', ajouter_livre, name='ajouter_livre'),
     path('lecture/<int:id>/supprimer/', supprimer_lecture, name='supprimer_lecture'),
     path('lecture/<int:id>/modifier/', modifier_lecture, name='modifier_lecture'),
+    path('lecture/<int:id>/', maj_lecture, name='maj_lecture'),
+    path('lecture/marque_pages/', synchroniser_marque_pages, name='synchroniser_marque_pages'),
     path('lecture/<int:id>/modifier_mp/', modifier_marque_pages, name='modifier_marque_pages'),
     path('lecture/<int:id>/modifier_statut', modifier_statut_lecture, name='modifier_statut_lecture'),
     path('lecture/<int:id>/modifier_date_debut', modifier_date_debut_lecture, name='modifier_date_debut_lecture'),
@@ -1,16 +1,50 @@
+import json
+from datetime import datetime, timezone as fuseau
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.core.exceptions import PermissionDenied
-from .forms import LivreForm, AuteurForm, TagForm, SearchForm, SearchLivreForm, SearchLectureForm, LectureForm, MarquePagesForm, UserForm, UserUpdateForm, CustomPasswordChangeForm, StatutLectureForm, DateDebutLectureForm, DateFinLectureForm, NoteLectureForm, CommentaireLectureForm
-from api.models import Livre, Auteur, Tag, Lecture, User
+from asgiref.sync import sync_to_async
+from .pagination import paginer_par_curseur, paginer_par_numero, apaginer_par_curseur, apaginer_par_numero
+from .forms import LivreForm, AuteurForm, TagForm, SearchForm, SearchLivreForm, SearchLectureForm, LectureForm, LecturePartielleForm, MarquePagesForm, UserForm, UserUpdateForm, CustomPasswordChangeForm, StatutLectureForm, DateDebutLectureForm, DateFinLectureForm, NoteLectureForm, CommentaireLectureForm
+from api.models import Livre, Auteur, Tag, Lecture, User, Recommandation
 from django.contrib.auth.decorators import login_required, permission_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.models import Group
-from django.views.decorators.http import require_POST
-from api.utils import est_majeur
+from django.views.decorators.http import require_POST, require_http_methods
+from api.utils import politique_contenu
+from api.recherche import RechercheLivres
+from api.statistiques import tableau_de_bord
+from api.versions import conditionnel, cle, TOUS, toucher_utilisateurs
+from .fragments import contexte_fragments, acontexte_fragments, prefetcher_cartes, aprefetcher_cartes
+from .autocompletion import INDEX, LIMITE, LIMITE_MAX, suggestions
+from .exports import FORMATS, COLONNES_CATALOGUE, COLONNES_LECTURES, lignes_catalogue, lignes_lectures, reponse_export
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Avg
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Q, Case, When, Value
+from django.http import JsonResponse, Http404
+from django.utils import timezone
+
+arender = sync_to_async(render)
+
+async def autilisateur(request):
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+def _variantes_html(request):
+    return (request.user.pk, politique_contenu(request).voir_pour_adulte, request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+
+def _cles_utilisateur(request):
+    if not request.user.is_authenticated:
+        return []
+    return [cle('utilisateur', request.user.pk), cle('utilisateur', TOUS)]
+
+def _cles_detail_livre(request, id):
+    return [cle('livre', id), cle('livre', TOUS), *_cles_utilisateur(request)]
+
+def _cles_detail_auteur(request, id):
+    return [cle('auteur', id), cle('auteur', TOUS), *_cles_utilisateur(request)]
 
 def signup(request):
     if request.method == 'POST':
@@ -128,45 +162,84 @@ def ajax_toggle_user_group(request, group_id, user_id):
         'group_id': group_id
     })
 
+def _recherche_livres(request):
+    recherche = RechercheLivres()
+    search_form = SearchLivreForm(request.GET)
+    if search_form.is_valid():
+        recherche = RechercheLivres(
+            texte=search_form.cleaned_data['recherche'],
+            tags=search_form.cleaned_data['tags'],
+            mode_tags=search_form.cleaned_data['mode_tags'],
+            auteur=search_form.cleaned_data['auteur'],
+            tri=search_form.cleaned_data['tri']
+        )
+    livres = recherche.appliquer(Livre.visibles.pour(request))
+    return livres, recherche, search_form
+
 def lister_livres(request):
-    if request.user.is_authenticated and est_majeur(request.user) and not request.user.cacher_pour_adulte:
-        livres = Livre.objects.prefetch_related('auteurs')
+    livres, recherche, search_form = _recherche_livres(request)
+    total = livres.count()
+    if recherche.champ_curseur:
+        livres, pagination = paginer_par_curseur(request, livres, champ=recherche.champ_curseur)
     else:
-        livres = Livre.objects.exclude(tags__pour_adulte=True).prefetch_related('auteurs')
-    if request.method == 'POST':
-        search_form = SearchLivreForm(request.POST)
-        if search_form.is_valid():
-            recherche = search_form.cleaned_data['recherche']
-            tags_recherche = search_form.cleaned_data['tags']
-            auteur_recherche = search_form.cleaned_data['auteur']
-            if recherche == "":
-                if request.user.is_authenticated and est_majeur(request.user) and not request.user.cacher_pour_adulte:
-                    livres = Livre.objects.prefetch_related('auteurs')
-                else:
-                    livres = Livre.objects.exclude(tags__pour_adulte=True).prefetch_related('auteurs')
-            else:
-                if request.user.is_authenticated and est_majeur(request.user) and not request.user.cacher_pour_adulte:
-                    livres = Livre.objects.filter(nom__icontains=recherche).prefetch_related('auteurs')
-                else:
-                    livres = Livre.objects.exclude(tags__pour_adulte=True).filter(nom__icontains=recherche).prefetch_related('auteurs')
-            if len(tags_recherche)>0:
-                for tag_recherche in tags_recherche:
-                    if request.user.is_authenticated and est_majeur(request.user) and not request.user.cacher_pour_adulte:
-                        livres = Livre.objects.filter(tags__id=tag_recherche.id).distinct().prefetch_related('auteurs')
-                    else:
-                        livres = Livre.objects.exclude(tags__pour_adulte=True).filter(tags__id=tag_recherche.id).distinct().prefetch_related('auteurs')
-            if auteur_recherche:
-                if request.user.is_authenticated and est_majeur(request.user) and not request.user.cacher_pour_adulte:
-                    livres = Livre.objects.filter(auteurs__id=auteur_recherche.id).prefetch_related('auteurs')
-                else:
-                    livres = Livre.objects.exclude(tags__pour_adulte=True).filter(auteurs__id=auteur_recherche.id).prefetch_related('auteurs')
+        livres, pagination = paginer_par_numero(request, livres)
+    fragments = contexte_fragments(request)
+    prefetcher_cartes(livres, fragments)
+    return render(request, 'livres/liste_livres.html', {'livres': livres, 'total': total, 'pagination': pagination, 'search_form': search_form, 'fragments': fragments})
+
+async def lister_livres_async(request):
+    livres, recherche, search_form = await sync_to_async(_recherche_livres)(request)
+    total = await livres.acount()
+    if recherche.champ_curseur:
+        livres, pagination = await apaginer_par_curseur(request, livres, champ=recherche.champ_curseur)
     else:
-        search_form = SearchLivreForm()
-    return render(request, 'livres/liste_livres.html', {'livres': livres, 'search_form': search_form})
+        livres, pagination = await apaginer_par_numero(request, livres)
+    fragments = await acontexte_fragments(request)
+    await aprefetcher_cartes(livres, fragments)
+    return await arender(request, 'livres/liste_livres.html', {'livres': livres, 'total': total, 'pagination': pagination, 'search_form': search_form, 'fragments': fragments})
 
+def _livres_detail(request):
+    livres = Livre.objects.prefetch_related('auteurs', 'tags')
+    if request.user.is_authenticated:
+        livres = livres.annotate(
+            souhait=Exists(User.liste_de_souhaits.through.objects.filter(user_id=request.user.id, livre_id=OuterRef('pk')))
+        ).prefetch_related(
+            Prefetch('lecture_set', queryset=Lecture.objects.filter(lecteur=request.user), to_attr='lectures_lecteur')
+        )
+    return livres
+
+@conditionnel(_cles_detail_livre, _variantes_html, prive=True)
 def detail_livre(request, id):
-    livre = get_object_or_404(Livre, id=id)
-    if len(livre.tags.filter(pour_adulte=True))>0 and (not request.user.is_authenticated or not est_majeur(request.user) or request.user.cacher_pour_adulte):
+    livre = get_object_or_404(_livres_detail(request), id=id)
+    return render(request, 'livres/detail_livre.html', _contexte_detail_livre(request, livre))
+
+@conditionnel(_cles_detail_livre, _variantes_html, prive=True)
+async def detail_livre_async(request, id):
+    await autilisateur(request)
+    try:
+        livre = await _livres_detail(request).aget(id=id)
+    except Livre.DoesNotExist:
+        raise Http404("Aucun livre ne correspond.")
+    return await arender(request, 'livres/detail_livre.html', _contexte_detail_livre(request, livre))
+
+def _pages_restantes(lecture, livre):
+    if lecture.marque_pages:
+        return livre.nombre_pages - lecture.marque_pages
+    return None
+
+def _moyenne(livre):
+    if livre.moyenne_notes:
+        return round(livre.moyenne_notes, 1)
+    return livre.moyenne_notes
+
+def _recommandations(request, livre):
+    recommandations = Recommandation.objects.filter(livre=livre).select_related('recommande').order_by('type', 'rang')
+    if not politique_contenu(request).voir_pour_adulte:
+        recommandations = recommandations.filter(recommande__est_pour_adulte=False)
+    return recommandations
+
+def _contexte_detail_livre(request, livre):
+    if not politique_contenu(request).peut_voir(livre):
         raise PermissionDenied("Vous ne pouvez pas voir ce contenu.")
     auteurs = livre.auteurs.all()
     tags = livre.tags.all()
@@ -182,26 +255,22 @@ def detail_livre(request, id):
     pages_restantes = None
 
     if request.user.is_authenticated:
-        if len(Lecture.objects.filter(lecteur=request.user, livre=livre))!=0:
-            lecture = Lecture.objects.filter(lecteur=request.user, livre=livre).first()
+        if livre.lectures_lecteur:
+            lecture = livre.lectures_lecteur[0]
+            lecture.livre = livre
             marque_pages_form = MarquePagesForm(instance=lecture)
             statut_lecture_form = StatutLectureForm(instance=lecture)
             date_debut_lecture_form = DateDebutLectureForm(instance=lecture)
             date_fin_lecture_form = DateFinLectureForm(instance=lecture)
             note_lecture_form = NoteLectureForm(instance=lecture)
             commentaire_lecture_form = CommentaireLectureForm(instance=lecture)
-            pages_restantes = None
-            if lecture.marque_pages:
-                pages_restantes = lecture.livre.nombre_pages - lecture.marque_pages
+            pages_restantes = _pages_restantes(lecture, livre)
             bouton_ajouter = False
-        if livre in Livre.objects.filter(user=request.user):
-            souhait = True
+        souhait = livre.souhait
 
-    moyenne = Lecture.objects.filter(livre=livre, note__isnull=False).aggregate(moyenne=Avg('note'))['moyenne']
-    if moyenne:
-        moyenne = round(moyenne, 1)
+    moyenne = _moyenne(livre)
 
-    return render(request, 'livres/detail_livre.html', {
+    return {
         'livre': livre, 
         'auteurs': auteurs, 
         'tags': tags, 
@@ -209,6 +278,7 @@ def detail_livre(request, id):
         'lecture': lecture, 
         'souhait': souhait, 
         'moyenne': moyenne,
+        'recommandations': _recommandations(request, livre),
         'marque_pages_form': marque_pages_form,
         'statut_lecture_form': statut_lecture_form,
         'date_debut_lecture_form': date_debut_lecture_form,
@@ -216,7 +286,7 @@ def detail_livre(request, id):
         'note_lecture_form': note_lecture_form,
         'commentaire_lecture_form': commentaire_lecture_form,
         'pages_restantes': pages_restantes
-    })
+    }
 
 @permission_required('api.creer_livre')
 def creer_livre(request):
@@ -232,7 +302,7 @@ def creer_livre(request):
 @permission_required('api.modifier_livre')
 def modifier_livre(request, id):
     livre = get_object_or_404(Livre, id=id)
-    if len(livre.tags.filter(pour_adulte=True))>0 and (not request.user.is_authenticated or not est_majeur(request.user) or request.user.cacher_pour_adulte):
+    if not politique_contenu(request).peut_voir(livre):
         raise PermissionDenied("Vous ne pouvez pas voir ce contenu.")
     livre_form = LivreForm(instance=livre)
     if request.method == 'POST':
@@ -252,25 +322,29 @@ def supprimer_livre(request, id):
 
 def liste_auteurs(request):
     auteurs = Auteur.objects.all()
-    if request.method == 'POST':
-        search_form = SearchForm(request.POST)
-        if search_form.is_valid():
-            recherche = search_form.cleaned_data['recherche']
-            if recherche == "":
-                auteurs = Auteur.objects.all()
-            else:
-                auteurs = Auteur.objects.filter(nom__icontains=recherche)
-    else:
-        search_form = SearchForm()
-    return render(request, 'auteurs/liste_auteurs.html', {'auteurs': auteurs, 'search_form': search_form})
-
+    search_form = SearchForm(request.GET, autocompletion='auteur')
+    if search_form.is_valid():
+        recherche = search_form.cleaned_data['recherche']
+        if recherche != "":
+            auteurs = Auteur.objects.filter(nom__icontains=recherche)
+    auteurs, pagination = paginer_par_curseur(request, auteurs)
+    return render(request, 'auteurs/liste_auteurs.html', {'auteurs': auteurs, 'pagination': pagination, 'search_form': search_form})
+
+@conditionnel(_cles_detail_auteur, _variantes_html, prive=True)
 def detail_auteur(request, id):
     auteur = get_object_or_404(Auteur, id=id)
-    if request.user.is_authenticated and est_majeur(request.user) and not request.user.cacher_pour_adulte:
-        livres = Livre.objects.filter(auteurs__id=auteur.id)
-    else:
-        livres = Livre.objects.exclude(tags__pour_adulte=True).filter(auteurs__id=auteur.id)
-    return render(request, 'auteurs/detail_auteur.html', {'auteur': auteur, 'livres': livres})
+    livres = Livre.visibles.pour(request).filter(auteurs__id=auteur.id)
+    return render(request, 'auteurs/detail_auteur.html', {'auteur': auteur, 'livres': livres, 'fragments': contexte_fragments(request)})
+
+@conditionnel(_cles_detail_auteur, _variantes_html, prive=True)
+async def detail_auteur_async(request, id):
+    await autilisateur(request)
+    try:
+        auteur = await Auteur.objects.aget(id=id)
+    except Auteur.DoesNotExist:
+        raise Http404("Aucun auteur ne correspond.")
+    livres = Livre.visibles.pour(request).filter(auteurs__id=auteur.id)
+    return await arender(request, 'auteurs/detail_auteur.html', {'auteur': auteur, 'livres': livres, 'fragments': await acontexte_fragments(request)})
 
 @permission_required('api.creer_auteur')
 def creer_auteur(request):
@@ -315,17 +389,13 @@ def creer_tag(request):
 
 def lister_tags(request):
     tags = Tag.objects.all()
-    if request.method == 'POST':
-        search_form = SearchForm(request.POST)
-        if search_form.is_valid():
-            recherche = search_form.cleaned_data['recherche']
-            if recherche == "":
-                tags = Tag.objects.all()
-            else:
-                tags = Tag.objects.filter(tag__icontains=recherche)
-    else:
-        search_form = SearchForm()
-    return render(request, 'tags/liste_tags.html', {'tags': tags, 'search_form': search_form})
+    search_form = SearchForm(request.GET, autocompletion='tag')
+    if search_form.is_valid():
+        recherche = search_form.cleaned_data['recherche']
+        if recherche != "":
+            tags = Tag.objects.filter(tag__icontains=recherche)
+    tags, pagination = paginer_par_curseur(request, tags, champ='tag')
+    return render(request, 'tags/liste_tags.html', {'tags': tags, 'identifiants_tags': [tag.id for tag in tags], 'pagination': pagination, 'search_form': search_form, 'fragments': contexte_fragments(request)})
 
 @permission_required('api.modifier_tag')
 def modifier_tag(request, id):
@@ -364,12 +434,19 @@ def bibliotheque(request):
                 lectures = lectures.filter(statut=statut)
     else:
         search_form = SearchLectureForm()
-    lectures_a_lire = lectures.filter(statut='a lire')
-    lectures_lues = lectures.filter(statut='lu')
-    lectures_en_cours = lectures.filter(statut='en cours')
-    lectures_abandonnees = lectures.filter(statut='abandonne')
-    lectures_en_pause = lectures.filter(statut='en pause')
-    return render(request, 'lectures/bibliotheque.html', {'lectures': lectures, 'lectures_a_lire': lectures_a_lire, 'lectures_lues': lectures_lues, 'lectures_en_cours': lectures_en_cours, 'lectures_abandonnees': lectures_abandonnees, 'lectures_en_pause': lectures_en_pause, 'search_form': search_form})
+    lectures = list(lectures.select_related('livre').prefetch_related('livre__auteurs'))
+    lectures_par_statut = {statut: [] for statut, _ in Lecture.STATUT_CHOICES}
+    for lecture in lectures:
+        lectures_par_statut.setdefault(lecture.statut, []).append(lecture)
+    return render(request, 'lectures/bibliotheque.html', {
+        'lectures': lectures,
+        'lectures_a_lire': lectures_par_statut['a lire'],
+        'lectures_lues': lectures_par_statut['lu'],
+        'lectures_en_cours': lectures_par_statut['en cours'],
+        'lectures_abandonnees': lectures_par_statut['abandonne'],
+        'lectures_en_pause': lectures_par_statut['en pause'],
+        'search_form': search_form
+    })
 
 @login_required
 def ajouter_livre(request, id):
@@ -513,6 +590,92 @@ def modifier_commentaire_lecture(request, id):
 
     return redirect('livres:detail_livre', id=lecture.livre.id)
 
+@login_required
+@require_http_methods(['PATCH'])
+def maj_lecture(request, id):
+    lecture = get_object_or_404(Lecture.objects.select_related('livre'), id=id)
+
+    if lecture.lecteur_id != request.user.pk:
+        raise PermissionDenied(f"Cette lecture n'appartient pas à {request.user}.")
+
+    try:
+        donnees = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'detail': "Corps JSON invalide."}, status=400)
+    champs_modifiables = LectureForm._meta.fields
+    if not isinstance(donnees, dict) or not donnees or set(donnees) - set(champs_modifiables):
+        return JsonResponse({'detail': f"Champs modifiables : {', '.join(champs_modifiables)}."}, status=400)
+
+    lecture_form = LecturePartielleForm(donnees, instance=lecture)
+    if not lecture_form.is_valid():
+        return JsonResponse({'erreurs': lecture_form.errors.get_json_data()}, status=400)
+
+    champs = set(lecture_form.changed_data)
+    if champs:
+        if lecture.statut == 'lu':
+            champs.add('marque_pages')
+        with transaction.atomic():
+            lecture_form.save(commit=False).save(update_fields=champs)
+        if 'note' in champs:
+            lecture.livre.refresh_from_db(fields=['moyenne_notes', 'nombre_notes'])
+
+    livre = lecture.livre
+    return JsonResponse({
+        'lecture': {champ: getattr(lecture, champ) for champ in champs_modifiables},
+        'modifies': sorted(champs),
+        'pages_restantes': _pages_restantes(lecture, livre),
+        'moyenne': _moyenne(livre),
+        'nombre_notes': livre.nombre_notes,
+    })
+
+MARQUE_PAGES_PAR_REQUETE = 100
+ENTIER_MAX = 2**31 - 1
+
+def _marque_pages_recus(corps):
+    donnees = json.loads(corps)
+    entrees = donnees.get('marque_pages') if isinstance(donnees, dict) else None
+    if not isinstance(entrees, list) or not 0 < len(entrees) <= MARQUE_PAGES_PAR_REQUETE:
+        raise ValueError
+    maintenant = timezone.now()
+    recus = {}
+    for entree in entrees:
+        lecture, page, horodatage = entree['lecture'], entree['page'], entree['horodatage']
+        if any(type(valeur) is not int for valeur in (lecture, page, horodatage)):
+            raise ValueError
+        if not (0 < lecture <= ENTIER_MAX and 0 <= page <= ENTIER_MAX and horodatage >= 0):
+            raise ValueError
+        horodatage = min(datetime.fromtimestamp(horodatage / 1000, fuseau.utc), maintenant)
+        if lecture not in recus or recus[lecture][1] < horodatage:
+            recus[lecture] = (page, horodatage)
+    return recus
+
+@login_required
+@require_POST
+def synchroniser_marque_pages(request):
+    try:
+        recus = _marque_pages_recus(request.body)
+    except (ValueError, TypeError, KeyError, OverflowError, OSError):
+        return JsonResponse({'detail': f"Attendu : marque_pages, liste de 1 à {MARQUE_PAGES_PAR_REQUETE} entrées (lecture, page, horodatage en ms)."}, status=400)
+
+    nombres_pages = dict(Lecture.objects.filter(id__in=list(recus), lecteur_id=request.user.pk).values_list('id', 'livre__nombre_pages'))
+    rejetes = [{'lecture': id, 'page': page} for id, (page, _) in recus.items() if page > nombres_pages.get(id, page)]
+    valides = {id: entree for id, entree in recus.items() if entree[0] <= nombres_pages.get(id, entree[0])}
+
+    appliques = 0
+    if valides:
+        plus_recents = Q()
+        for id, (page, horodatage) in valides.items():
+            plus_recents |= Q(id=id) & (Q(marque_pages_horodatage__isnull=True) | Q(marque_pages_horodatage__lt=horodatage))
+        with transaction.atomic():
+            appliques = Lecture.objects.filter(plus_recents, lecteur_id=request.user.pk).exclude(statut='lu').update(
+                marque_pages=Case(*(When(id=id, then=Value(page)) for id, (page, _) in valides.items())),
+                marque_pages_horodatage=Case(*(When(id=id, then=Value(horodatage)) for id, (_, horodatage) in valides.items())),
+            )
+            if appliques:
+                toucher_utilisateurs([request.user.pk])
+
+    return JsonResponse({'recus': len(recus), 'appliques': appliques, 'rejetes': rejetes})
+
 @login_required
 def ajouter_souhait(request, id):
     livre = get_object_or_404(Livre, id=id)
@@ -534,5 +697,44 @@ def retirer_souhait(request, id):
 @login_required
 def liste_de_souhaits(request):
     livres = Livre.objects.filter(user=request.user)
+    total = livres.count()
+    livres, pagination = paginer_par_curseur(request, livres)
 
-    return render(request, 'liste_de_souhaits/liste_de_souhaits.html', {'livres': livres})
+    return render(request, 'liste_de_souhaits/liste_de_souhaits.html', {'livres': livres, 'total': total, 'pagination': pagination})
+
+async def liste_de_souhaits_async(request):
+    if not (await autilisateur(request)).is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    livres = Livre.objects.filter(user=request.user)
+    total = await livres.acount()
+    livres, pagination = await apaginer_par_curseur(request, livres)
+    return await arender(request, 'liste_de_souhaits/liste_de_souhaits.html', {'livres': livres, 'total': total, 'pagination': pagination})
+
+def autocompletion(request):
+    type = request.GET.get('type')
+    if type not in INDEX:
+        return JsonResponse({'detail': "Type d'autocomplétion inconnu."}, status=400)
+    try:
+        limite = min(max(int(request.GET.get('limite', LIMITE)), 1), LIMITE_MAX)
+    except ValueError:
+        limite = LIMITE
+    resultats = suggestions(type, request.GET.get('q', ''), limite, adulte=politique_contenu(request).voir_pour_adulte)
+    return JsonResponse({'resultats': resultats})
+
+def statistiques(request):
+    personnelles = request.user.is_authenticated and request.GET.get('portee') != 'site'
+    contexte = tableau_de_bord(request.user if personnelles else None, adulte=politique_contenu(request).voir_pour_adulte)
+    return render(request, 'statistiques/statistiques.html', {**contexte, 'personnelles': personnelles})
+
+def exporter_catalogue(request, format):
+    if format not in FORMATS:
+        raise Http404("Format d'export inconnu.")
+    livres = Livre.visibles.pour(request).order_by('id')
+    return reponse_export('catalogue', format, COLONNES_CATALOGUE, lignes_catalogue(livres))
+
+@login_required
+def exporter_lectures(request, format):
+    if format not in FORMATS:
+        raise Http404("Format d'export inconnu.")
+    lectures = Lecture.objects.filter(lecteur=request.user).order_by('id')
+    return reponse_export('lectures', format, COLONNES_LECTURES, lignes_lectures(lectures))
@@ -0,0 +1,35 @@
+from django import forms
+from django.urls import reverse
+
+class AutocompletionMixin:
+    def __init__(self, type, attrs=None, **kwargs):
+        super().__init__(attrs, **kwargs)
+        self.type = type
+
+    class Media:
+        js = ['js/autocompletion.js']
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocompletion'] = f"{reverse('livres:autocompletion')}?type={self.type}"
+        return context
+
+class SaisieAutocompletee(AutocompletionMixin, forms.TextInput):
+    pass
+
+class SelectionDistante(AutocompletionMixin, forms.Select):
+    def _choix_selectionnes(self, selection):
+        selection = [valeur for valeur in selection if str(valeur).isdigit()]
+        if not selection:
+            return []
+        return [self.choices.choice(objet) for objet in self.choices.queryset.filter(pk__in=selection)]
+
+    def optgroups(self, name, value, attrs=None):
+        choix = self._choix_selectionnes(value)
+        options = [] if self.allow_multiple_selected else [self.create_option(name, '', '', not choix, 0)]
+        for index, (valeur, libelle) in enumerate(choix, start=len(options)):
+            options.append(self.create_option(name, valeur, libelle, True, index))
+        return [(None, options, 0)]
+
+class SelectionMultipleDistante(SelectionDistante, forms.SelectMultiple):
+    pass
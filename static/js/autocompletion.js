@@ -0,0 +1,128 @@
+(function () {
+    const DELAI = 150;
+
+    function interroger(champ, texte, afficher) {
+        let minuterie;
+        let controleur;
+        return function () {
+            clearTimeout(minuterie);
+            minuterie = setTimeout(async () => {
+                const valeur = texte();
+                if (controleur) {
+                    controleur.abort();
+                }
+                if (!valeur) {
+                    afficher([]);
+                    return;
+                }
+                controleur = new AbortController();
+                try {
+                    const reponse = await fetch(`${champ.dataset.autocompletion}&q=${encodeURIComponent(valeur)}`, { signal: controleur.signal });
+                    const donnees = await reponse.json();
+                    afficher(donnees.resultats || []);
+                } catch (erreur) {
+                    if (erreur.name !== 'AbortError') {
+                        console.error(erreur);
+                    }
+                }
+            }, DELAI);
+        };
+    }
+
+    function initialiserSaisie(saisie) {
+        const suggestions = document.createElement('datalist');
+        suggestions.id = `${saisie.id || saisie.name}-suggestions`;
+        saisie.setAttribute('list', suggestions.id);
+        saisie.setAttribute('autocomplete', 'off');
+        saisie.after(suggestions);
+        saisie.addEventListener('input', interroger(saisie, () => saisie.value.trim(), resultats => {
+            suggestions.replaceChildren(...resultats.map(resultat => new Option(resultat.libelle)));
+        }));
+    }
+
+    function initialiserSelection(select) {
+        const conteneur = document.createElement('div');
+        conteneur.className = 'selection-distante position-relative';
+        const puces = document.createElement('div');
+        puces.className = 'd-flex flex-wrap gap-2 mb-2';
+        const saisie = document.createElement('input');
+        saisie.type = 'search';
+        saisie.className = 'form-control';
+        saisie.placeholder = select.multiple ? 'Ajouter…' : 'Choisir…';
+        saisie.autocomplete = 'off';
+        const liste = document.createElement('div');
+        liste.className = 'list-group position-absolute w-100 shadow-sm d-none';
+        liste.style.zIndex = 1050;
+        select.parentNode.insertBefore(conteneur, select);
+        select.classList.add('d-none');
+        conteneur.append(puces, saisie, liste, select);
+
+        function afficherPuces() {
+            puces.replaceChildren(...Array.from(select.selectedOptions).filter(option => option.value).map(option => {
+                const puce = document.createElement('span');
+                puce.className = 'badge rounded-pill text-bg-primary d-inline-flex align-items-center';
+                puce.textContent = option.textContent;
+                const retirer = document.createElement('button');
+                retirer.type = 'button';
+                retirer.className = 'btn-close btn-close-white ms-2';
+                retirer.setAttribute('aria-label', `Retirer ${option.textContent}`);
+                retirer.addEventListener('click', () => {
+                    option.remove();
+                    afficherPuces();
+                });
+                puce.append(retirer);
+                return puce;
+            }));
+        }
+
+        function choisir(resultat) {
+            if (!select.multiple) {
+                Array.from(select.options).filter(option => option.value).forEach(option => option.remove());
+            }
+            let option = Array.from(select.options).find(option => option.value === String(resultat.id));
+            if (!option) {
+                option = new Option(resultat.libelle, resultat.id);
+                select.add(option);
+            }
+            option.selected = true;
+            saisie.value = '';
+            liste.classList.add('d-none');
+            afficherPuces();
+        }
+
+        saisie.addEventListener('input', interroger(select, () => saisie.value.trim(), resultats => {
+            liste.replaceChildren(...resultats.map(resultat => {
+                const bouton = document.createElement('button');
+                bouton.type = 'button';
+                bouton.className = 'list-group-item list-group-item-action';
+                bouton.textContent = resultat.libelle;
+                bouton.addEventListener('click', () => choisir(resultat));
+                return bouton;
+            }));
+            liste.classList.toggle('d-none', resultats.length === 0);
+        }));
+        saisie.addEventListener('keydown', evenement => {
+            if (evenement.key === 'Enter' && !liste.classList.contains('d-none')) {
+                evenement.preventDefault();
+                const premier = liste.querySelector('button');
+                if (premier) {
+                    premier.click();
+                }
+            } else if (evenement.key === 'Escape') {
+                liste.classList.add('d-none');
+            }
+        });
+        document.addEventListener('click', evenement => {
+            if (!conteneur.contains(evenement.target)) {
+                liste.classList.add('d-none');
+            }
+        });
+        select.addEventListener('change', afficherPuces);
+        afficherPuces();
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        document.querySelectorAll('input[data-autocompletion]').forEach(initialiserSaisie);
+        document.querySelectorAll('select[data-autocompletion]').forEach(initialiserSelection);
+    });
+})();
@@ -0,0 +1,116 @@
+(function () {
+    function basculer(id, visible, valeur) {
+        const bloc = document.getElementById(id);
+        if (!bloc) {
+            return;
+        }
+        bloc.classList.toggle('d-none', !visible);
+        if (valeur !== undefined) {
+            bloc.querySelector('[data-valeur]').textContent = valeur ?? '';
+        }
+    }
+
+    function afficher(donnees) {
+        const lecture = donnees.lecture;
+        basculer('moyenne', Boolean(donnees.moyenne), donnees.moyenne);
+        basculer('marque-pages-pause', Boolean(lecture.marque_pages) && lecture.statut === 'en pause', lecture.marque_pages);
+        basculer('pages-restantes', !['lu', 'a lire'].includes(lecture.statut) && Boolean(donnees.pages_restantes), donnees.pages_restantes);
+        basculer('marque-pages', lecture.statut === 'en cours');
+        const marquePages = document.querySelector('#marque-pages [name="marque_pages"]');
+        if (marquePages) {
+            marquePages.value = lecture.marque_pages ?? '';
+        }
+    }
+
+    function signaler(formulaire, erreurs) {
+        formulaire.querySelectorAll('.invalid-feedback').forEach(message => message.remove());
+        formulaire.querySelectorAll('[name]:not([type="hidden"])').forEach(champ => {
+            const messages = erreurs && erreurs[champ.name];
+            champ.classList.toggle('is-invalid', Boolean(messages));
+            champ.classList.toggle('is-valid', !messages);
+            if (messages) {
+                const message = document.createElement('div');
+                message.className = 'invalid-feedback';
+                message.textContent = messages.map(erreur => erreur.message).join(' ');
+                champ.after(message);
+            }
+        });
+    }
+
+    const DELAI_SYNCHRONISATION = 1000;
+
+    function synchroniser(conteneur) {
+        const saisie = conteneur.querySelector('#marque-pages [name="marque_pages"]');
+        const jeton = conteneur.querySelector('[name="csrfmiddlewaretoken"]').value;
+        let enAttente = null;
+        let minuterie;
+
+        function envoyer() {
+            clearTimeout(minuterie);
+            if (!enAttente) {
+                return;
+            }
+            const corps = JSON.stringify({ marque_pages: [enAttente] });
+            enAttente = null;
+            fetch(conteneur.dataset.synchronisation, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'X-CSRFToken': jeton },
+                body: corps,
+                keepalive: true,
+            }).catch(erreur => console.error(erreur));
+        }
+
+        saisie.addEventListener('input', () => {
+            const page = Number.parseInt(saisie.value, 10);
+            if (Number.isNaN(page) || page < 0 || page > Number(conteneur.dataset.nombrePages)) {
+                return;
+            }
+            enAttente = { lecture: Number(conteneur.dataset.id), page: page, horodatage: Date.now() };
+            const restantes = Number(conteneur.dataset.nombrePages) - page;
+            basculer('pages-restantes', page > 0 && restantes > 0, restantes);
+            clearTimeout(minuterie);
+            minuterie = setTimeout(envoyer, DELAI_SYNCHRONISATION);
+        });
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') {
+                envoyer();
+            }
+        });
+        window.addEventListener('pagehide', envoyer);
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        const conteneur = document.getElementById('lecture');
+        synchroniser(conteneur);
+        conteneur.querySelectorAll('form[data-lecture]').forEach(formulaire => {
+            formulaire.addEventListener('submit', async evenement => {
+                evenement.preventDefault();
+                const corps = {};
+                new FormData(formulaire).forEach((valeur, champ) => {
+                    if (champ !== 'csrfmiddlewaretoken') {
+                        corps[champ] = valeur === '' ? null : valeur;
+                    }
+                });
+                try {
+                    const reponse = await fetch(conteneur.dataset.url, {
+                        method: 'PATCH',
+                        headers: {
+                            'Content-Type': 'application/json',
+                            'X-CSRFToken': formulaire.elements.csrfmiddlewaretoken.value,
+                        },
+                        body: JSON.stringify(corps),
+                    });
+                    const donnees = await reponse.json();
+                    if (!reponse.ok) {
+                        signaler(formulaire, donnees.erreurs || {});
+                        return;
+                    }
+                    signaler(formulaire, null);
+                    afficher(donnees);
+                } catch (erreur) {
+                    formulaire.submit();
+                }
+            });
+        });
+    });
+})();